@@ -0,0 +1,314 @@
+"""
+Title: Benchmark Suite
+Desc:  Times the analysis hot paths on synthetic data & records machine readable results
+
+Runs offline, with price downloads swapped for synthetic histories. Each case is
+timed over several repeats, then run once more under tracemalloc for its peak memory.
+
+Usage:
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --quick --filter drawdown
+    python benchmarks/run_benchmarks.py --output new.json --compare old.json
+"""
+
+import argparse
+import gc
+import inspect
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+for directory in ("dividends_vs_growth", "margin_call_analysis"):
+    sys.path.insert(0, os.path.join(REPO_DIR, directory))
+
+import synthetic  # noqa: E402
+
+
+# Registered benchmarks as (name, parameter grid, setup)
+BENCHMARKS = []
+
+YEARS = [1, 10, 50]
+SCENARIOS = [1, 1000, 100000]
+LVR_STEPS = [10, 100, 1000]
+
+
+def benchmark(name, **grid):
+    """Registers a benchmark
+
+    The decorated setup function is called with each combination of the grid's
+    parameters & returns the zero argument callable to time. Setup isn't timed.
+    Setups needing to undo something afterwards, eg a patch, can instead yield the
+    callable & clean up after the yield.
+
+    Args:
+        name (str): Benchmark name, eg module.function
+        **grid (list): Values to run for each parameter
+    """
+
+    def register(setup):
+        BENCHMARKS.append((name, grid, setup))
+        return setup
+
+    return register
+
+
+@benchmark("tax.tax", n_incomes=[1000, 100000])
+def bench_tax(n_incomes):
+    from tax_calculator import tax
+
+    incomes = np.random.default_rng(0).integers(0, 300000, n_incomes).tolist()
+    return lambda: [tax(x) for x in incomes]
+
+
+@benchmark("tax.tax_array", n_incomes=[1000, 100000, 1000000])
+def bench_tax_array(n_incomes):
+    from tax_calculator import tax_array
+
+    incomes = np.random.default_rng(0).uniform(0, 300000, n_incomes)
+    return lambda: tax_array(incomes)
+
+
+@benchmark("growth.calculate_growth", years=YEARS)
+def bench_calculate_growth(years):
+    from GrowthCalculator import GrowthCalculator
+
+    return lambda: GrowthCalculator(90000, 100000, 0.06, 0.04, years).calculate_growth(final_year_liquidation=True)
+
+
+@benchmark("growth.calculate_growth_loop", n_scenarios=[1, 100, 1000])
+def bench_calculate_growth_loop(n_scenarios):
+    from GrowthCalculator import GrowthCalculator
+
+    grid = synthetic.scenario_grid(n_scenarios)
+    scenarios = list(zip(*(grid[col].tolist() for col in ("salary", "starting_investment", "capital_growth", "dividend_payout", "years"))))
+
+    return lambda: [GrowthCalculator(*x).calculate_growth(final_year_liquidation=True) for x in scenarios]
+
+
+@benchmark("growth.calculate_growth_batch", n_scenarios=SCENARIOS)
+def bench_calculate_growth_batch(n_scenarios):
+    from GrowthCalculator import calculate_growth_batch
+
+    grid = synthetic.scenario_grid(n_scenarios)
+    return lambda: calculate_growth_batch(final_year_liquidation=True, **grid)
+
+
+@benchmark("yahoo.parse_yahoo_csv", years=YEARS)
+def bench_parse_yahoo_csv(years):
+    from yahoo_finance import parse_yahoo_csv
+
+    content = synthetic.synthetic_csv(years)
+    return lambda: parse_yahoo_csv(content, "D")
+
+
+@benchmark("helpers.calc_drawdown", years=YEARS, window_size=[20, 250])
+def bench_calc_drawdown(years, window_size):
+    from helpers import calc_drawdown
+
+    # calc_drawdown only overwrites its own column, so the same frame is reused rather
+    # than timing a copy on every call
+    df = synthetic.synthetic_history(years)
+    return lambda: calc_drawdown(df, "Close", window_size)
+
+
+@benchmark("helpers.calc_lvr", years=YEARS)
+def bench_calc_lvr(years):
+    from helpers import calc_lvr
+
+    df = synthetic.alpha_vantage_frame(years)
+    return lambda: calc_lvr(df, 100000, 0.5)
+
+
+@benchmark("helpers.margin_call_samples", years=YEARS, lvr_steps=LVR_STEPS)
+def bench_margin_call_samples(years, lvr_steps):
+    import helpers
+
+    history = synthetic.synthetic_history(years)
+    lvr_lookup = helpers.create_margin_call_range_table(0.7, buffer=0.1, step_size=0.8 / lvr_steps)
+
+    # Served from memory rather than downloaded, until the case has finished
+    with mock.patch.object(helpers, "get_yahoo_history", lambda **kwargs: history.copy()):
+        yield lambda: helpers.margin_call_samples("SYN.AX", "daily", 250, lvr_lookup.copy())
+
+
+@benchmark("plotly.timeseries_long", n_symbols=[10, 50, 200])
+def bench_timeseries_long(n_symbols):
+    from plotly_utilities import timeseries
+
+    df = synthetic.long_frame(n_symbols, 10)
+    keys = df["symbol"].unique().tolist()
+    return lambda: timeseries(df, "date", "close", shape="long", key_col="symbol", keys=keys)
+
+
+@benchmark("plotly.histogram_long", n_symbols=[10, 50, 200])
+def bench_histogram_long(n_symbols):
+    from plotly_utilities import histogram
+
+    df = synthetic.long_frame(n_symbols, 10)
+    keys = df["symbol"].unique().tolist()
+    return lambda: histogram(df, "close", shape="long", key_col="symbol", keys=keys, type="probability")
+
+
+def time_case(fn, repeat, min_time=0.05):
+    """Seconds per call, looping fast calls until each repeat takes at least min_time
+
+    Returns:
+        list: Seconds per call for each repeat
+        int: Calls per repeat
+    """
+
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    loops = max(1, int(min_time / elapsed)) if elapsed > 0 else 1000
+
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        timings.append((time.perf_counter() - start) / loops)
+
+    return timings, loops
+
+
+def peak_memory(fn):
+    """Peak bytes allocated by Python & numpy during a single call"""
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak
+
+
+def run_case(name, params, setup, repeat):
+    """Times & measures one benchmark case, recording why if it couldn't be run"""
+
+    result = {"name": name, "params": params}
+
+    try:
+        case = setup(**params)
+        fn = next(case) if inspect.isgenerator(case) else case
+    except (ImportError, AttributeError) as e:
+        # Benchmarks for functions a commit doesn't have yet are skipped, so old commits still run
+        result["skipped"] = "{}: {}".format(type(e).__name__, e)
+        return result
+
+    try:
+        timings, loops = time_case(fn, repeat)
+        result.update(
+            {
+                "seconds_min": min(timings),
+                "seconds_median": float(np.median(timings)),
+                "repeat": repeat,
+                "loops": loops,
+                "peak_memory_bytes": peak_memory(fn),
+            }
+        )
+    finally:
+        # Runs a yielding setup's clean up
+        if inspect.isgenerator(case):
+            case.close()
+
+    return result
+
+
+def case_id(result):
+    """Key identifying a case across result files"""
+
+    params = ",".join("{}={}".format(k, v) for k, v in result["params"].items())
+    return "{}[{}]".format(result["name"], params)
+
+
+def environment():
+    """Details of the commit & machine the results came from"""
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results, baseline_path):
+    """Prints the speed up & memory change of each case against an earlier results file"""
+
+    with open(baseline_path) as f:
+        baseline = {case_id(x): x for x in json.load(f)["results"] if "skipped" not in x}
+
+    print("\n{:<70} {:>10} {:>10}".format("vs " + os.path.basename(baseline_path), "speed up", "memory"))
+    for result in results:
+        old = baseline.get(case_id(result))
+        if old is None or "skipped" in result:
+            continue
+
+        speed_up = old["seconds_min"] / result["seconds_min"]
+        memory = result["peak_memory_bytes"] / old["peak_memory_bytes"] if old["peak_memory_bytes"] else float("nan")
+        print("{:<70} {:>9.2f}x {:>9.2f}x".format(case_id(result), speed_up, memory))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the analysis hot paths on synthetic data")
+    parser.add_argument("--output", help="Write results to this json file")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed repeats per case")
+    parser.add_argument("--quick", action="store_true", help="Only the two smallest sizes of each parameter")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    results = []
+    for name, grid, setup in BENCHMARKS:
+        if args.filter not in name:
+            continue
+
+        values = [v[:2] if args.quick else v for v in grid.values()]
+        for combination in itertools.product(*values):
+            result = run_case(name, dict(zip(grid.keys(), combination)), setup, args.repeat)
+            results.append(result)
+
+            if "skipped" in result:
+                print("{:<70} skipped ({})".format(case_id(result), result["skipped"]))
+            else:
+                print("{:<70} {:>10.6f}s {:>10.1f}MB".format(
+                    case_id(result), result["seconds_min"], result["peak_memory_bytes"] / 1e6
+                ))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
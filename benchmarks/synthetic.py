@@ -0,0 +1,147 @@
+"""
+Title: Synthetic Data Generators
+Desc:  Reproducible price histories & scenario grids for the benchmark suite, no network required
+"""
+
+import numpy as np
+import pandas as pd
+
+
+TRADING_DAYS = 252
+
+
+def synthetic_returns(n, seed=0, drift=0.07, volatility=0.2, crash_every=2500, crash_size=0.35):
+    """Daily log returns with fat tailed noise & the odd crash, so drawdowns look realistic
+
+    Args:
+        n (int): Number of returns
+        seed (int, optional): Defaults to 0. Random seed
+        drift (float, optional): Defaults to 0.07. Annual drift
+        volatility (float, optional): Defaults to 0.2. Annual volatility
+        crash_every (int, optional): Defaults to 2500. Average bars between crashes
+        crash_size (float, optional): Defaults to 0.35. Fall spread over each crash
+
+    Returns:
+        numpy.ndarray: Log returns
+    """
+
+    rng = np.random.default_rng(seed)
+    returns = drift / TRADING_DAYS + volatility / np.sqrt(TRADING_DAYS) * rng.standard_t(4, n) / np.sqrt(2)
+
+    # Crashes play out over a couple of months
+    for start in np.flatnonzero(rng.random(n) < 1 / crash_every):
+        returns[start:start + 40] += np.log(1 - crash_size) / 40
+
+    return returns
+
+
+def synthetic_history(years, seed=0, start_date="1975-01-01", start_price=10.0):
+    """Daily EOD data in the shape returned by get_yahoo_history
+
+    Args:
+        years (int): Years of trading days to generate
+        seed (int, optional): Defaults to 0. Random seed
+        start_date (str, optional): Defaults to "1975-01-01". First trading day
+        start_price (float, optional): Defaults to 10. First close
+
+    Returns:
+        data.frame: Open, High, Low, Close, Adj Close & Volume with a Date column & DatetimeIndex
+    """
+
+    dates = pd.bdate_range(start_date, periods=int(years * TRADING_DAYS), name="Date")
+    n = len(dates)
+    rng = np.random.default_rng(seed + 1)
+
+    close = start_price * np.exp(np.cumsum(synthetic_returns(n, seed)))
+    open_ = np.empty(n)
+    open_[0] = start_price
+    open_[1:] = close[:-1]
+    spread = np.abs(rng.normal(0, 0.005, n))
+
+    return pd.DataFrame(
+        {
+            "Date": dates,
+            "Open": open_,
+            "High": np.maximum(open_, close) * (1 + spread),
+            "Low": np.minimum(open_, close) * (1 - spread),
+            "Close": close,
+            "Adj Close": close,
+            "Volume": rng.integers(1e5, 1e7, n).astype(np.float64),
+        },
+        index=dates,
+    )
+
+
+def synthetic_csv(years, seed=0):
+    """Raw Yahoo csv download body for a synthetic history
+
+    Args:
+        years (int): Years of trading days to generate
+        seed (int, optional): Defaults to 0. Random seed
+
+    Returns:
+        bytes: csv content, as returned by Yahoo's download endpoint
+    """
+
+    df = synthetic_history(years, seed)
+    df["Date"] = df["Date"].dt.strftime("%Y-%m-%d")
+
+    return df.to_csv(index=False, float_format="%.6f").encode()
+
+
+def alpha_vantage_frame(years, seed=0):
+    """Synthetic history in the shape returned by get_historical_data, for calc_lvr
+
+    Args:
+        years (int): Years of trading days to generate
+        seed (int, optional): Defaults to 0. Random seed
+
+    Returns:
+        data.frame: date & close columns with a RangeIndex
+    """
+
+    df = synthetic_history(years, seed)
+
+    return pd.DataFrame({"date": df["Date"].to_numpy(), "close": df["Close"].to_numpy()})
+
+
+def long_frame(n_symbols, years, seed=0):
+    """Long format close prices for many symbols, as plotted with shape='long'
+
+    Args:
+        n_symbols (int): Number of symbols
+        years (int): Years of trading days per symbol
+        seed (int, optional): Defaults to 0. Random seed
+
+    Returns:
+        data.frame: date, symbol & close columns
+    """
+
+    frames = []
+    for i in range(n_symbols):
+        df = synthetic_history(years, seed + i)
+        frames.append(pd.DataFrame({"date": df["Date"].to_numpy(), "symbol": "SYM{}".format(i), "close": df["Close"].to_numpy()}))
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def scenario_grid(n_scenarios, seed=0):
+    """Random GrowthCalculator scenarios
+
+    Args:
+        n_scenarios (int): Number of scenarios
+        seed (int, optional): Defaults to 0. Random seed
+
+    Returns:
+        dict: salary, starting_investment, capital_growth, dividend_payout & years arrays
+    """
+
+    rng = np.random.default_rng(seed)
+
+    return {
+        "salary": rng.choice(np.arange(40000, 250001, 5000), n_scenarios).astype(np.float64),
+        "starting_investment": rng.choice(np.arange(10000, 500001, 10000), n_scenarios).astype(np.float64),
+        "capital_growth": rng.uniform(0.0, 0.1, n_scenarios),
+        "dividend_payout": rng.uniform(0.0, 0.08, n_scenarios),
+        "years": rng.integers(5, 41, n_scenarios),
+    }
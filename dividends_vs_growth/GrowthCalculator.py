@@ -3,7 +3,93 @@ Title: Growth Calcualtor
 Description: 
 """
 
-from tax_calculator import tax
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from tax_calculator import CGTLedger, tax, tax_array
+
+
+class InvestmentHistory:
+    """Columnar store of the end of year stats produced by GrowthCalculator
+
+    Each stat is held in its own preallocated numpy array, sized for the full
+    simulation up front. Iterating or indexing still yields the old per year dicts,
+    while slicing gives another InvestmentHistory viewing the same arrays.
+    """
+
+    __slots__ = ('year', 'salary', 'dividend_income', 'excess_tax', 'capital', 'size')
+
+    FIELDS = ('year', 'salary', 'dividend_income', 'excess_tax', 'capital')
+
+    def __init__(self, years):
+        self.year = np.zeros(years + 1, dtype=np.int64)
+        self.salary = np.zeros(years + 1, dtype=np.float64)
+        self.dividend_income = np.zeros(years + 1, dtype=np.float64)
+        self.excess_tax = np.zeros(years + 1, dtype=np.float64)
+        self.capital = np.zeros(years + 1, dtype=np.float64)
+        self.size = 0
+
+    def append(self, year, salary, dividend_income, excess_tax, capital):
+        """Records a year's results
+
+        Args:
+            year (int): Year ID
+            salary (float): Salary for that year
+            dividend_income (float): Dividend income generated that year
+            excess_tax (float): Extra tax paid that year due to additional income
+            capital (float): Gross investment position
+        """
+
+        i = self.size
+        self.year[i] = year
+        self.salary[i] = salary
+        self.dividend_income[i] = dividend_income
+        self.excess_tax[i] = excess_tax
+        self.capital[i] = capital
+        self.size = i + 1
+
+    def column(self, field):
+        """Recorded values for a single stat
+
+        Args:
+            field (str): One of InvestmentHistory.FIELDS
+
+        Returns:
+            numpy.ndarray: View of the recorded values
+        """
+
+        return getattr(self, field)[:self.size]
+
+    def to_frame(self):
+        """DataFrame backed by the underlying arrays, without copying them
+
+        Returns:
+            DataFrame: One row per year
+        """
+
+        return pd.DataFrame({field: self.column(field) for field in self.FIELDS}, copy=False)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        """A year's stats as a dict, or for a slice an InvestmentHistory viewing the same arrays"""
+
+        if isinstance(i, slice):
+            view = InvestmentHistory.__new__(InvestmentHistory)
+            for field in self.FIELDS:
+                setattr(view, field, self.column(field)[i])
+            view.size = len(view.year)
+            return view
+
+        return {field: self.column(field)[i].item() for field in self.FIELDS}
+
+    def __iter__(self):
+        columns = [self.column(field).tolist() for field in self.FIELDS]
+        for row in zip(*columns):
+            yield dict(zip(self.FIELDS, row))
 
 
 class GrowthCalculator:
@@ -11,41 +97,50 @@ class GrowthCalculator:
     Simulates total returns, less tax, given a few basic parameters    
     """
 
-    def __init__(self, salary, starting_investment, capital_growth, dividend_payout, years):
+    def __init__(self, salary, starting_investment, capital_growth, dividend_payout, years, start_year=None):
         self.salary = salary
         self.starting_investment = starting_investment
         self.current_investment = starting_investment
         self.cg = capital_growth
         self.dp = dividend_payout
         self.years = years
-        self.salary_tax = tax(salary)
+        self.start_year = start_year
+        self.salary_tax = tax(salary, self.fin_year(1))
 
 
-    def eoy_stats(self, year, salary, dividend_income, excess_tax, capital):
-        """Object to capture results as generated
+    def fin_year(self, year):
+        """Financial year used to tax a simulated year
         
         Args:
-            year (int): Year ID
-            salary (float): Salary for that year
-            dividend_income (float): Dividend income generated that year
-            excess_tax (float): Extra tax paid that year due to additional income
-            capital (float): Gross investment position
+            year (int): Year ID, with year 1 being the first year invested
         
         Returns:
-            dict: Object containing summary stats
+            int: Financial year, or None to use the default tax rates (DEFAULT_FIN_YEAR)
         """
 
-        return {
-            'year': year,
-            'salary': salary,
-            'dividend_income': dividend_income,
-            'excess_tax': excess_tax,
-            'capital': capital
-        }
+        if self.start_year is None:
+            return None
+
+        return self.start_year + year - 1
+
+
+    @property
+    def eoy_stats(self):
+        """End of year stats from the last calculate_growth run, in their original list of dicts form
+
+        Returns:
+            list: One dict per year with year, salary, dividend_income, excess_tax & capital. Empty if not yet run
+        """
+
+        history = getattr(self, 'investment_history', None)
+
+        return [] if history is None else list(history)
 
 
     def compound_interest(self, principal, interest_rate, compounds_per_year, years):
         """Compound Interest Calculator
+
+        Deprecated, kept for existing callers. The simulator compounds year by year instead
         
         Args:
             principal (float): Initial principal 
@@ -57,11 +152,15 @@ class GrowthCalculator:
             float: Final return
         """
 
+        warnings.warn("compound_interest is deprecated", DeprecationWarning, stacklevel=2)
+
         return principal * (1 + interest_rate/compounds_per_year) ** (compounds_per_year * years)
 
 
     def taxable_capital_gains(self, initial_investment, years_held):
         """Calculates taxable capital gains over the life of an investment
+
+        Deprecated, kept for existing callers. Worked out with a CGTLedger, as the simulator does
         
         Args:
             initial_investment (float): Initial investment
@@ -71,13 +170,16 @@ class GrowthCalculator:
             float: Taxable component of capital gains
         """
 
-        current_value = self.compound_interest(initial_investment, self.cg, 1, years_held)
-        capital_gain = current_value - initial_investment
-        
-        if(years_held > 1):
-            return capital_gain/2
-        else:
-            return capital_gain
+        warnings.warn("taxable_capital_gains is deprecated, use CGTLedger", DeprecationWarning, stacklevel=2)
+
+        # Nothing else is bought, so the parcel qualifies for the discount after its first year
+        ledger = CGTLedger(initial_investment)
+        for year in range(1, years_held + 1):
+            ledger.grow(self.cg)
+            if year < years_held:
+                ledger.buy(0.0)
+
+        return ledger.taxable_capital_gains()
 
 
     def calculate_growth(self, final_year_liquidation=False):
@@ -88,56 +190,111 @@ class GrowthCalculator:
         """
 
         # Instantiate with current state pre investment
-        growth_history = [self.eoy_stats(
+        growth_history = InvestmentHistory(self.years)
+        growth_history.append(
                 year = 0,
                 salary = self.salary,
                 dividend_income = 0,
                 excess_tax =  0,
-                capital = self.starting_investment)]
+                capital = self.starting_investment)
+
+        # Cost base of the initial investment & each reinvested dividend
+        ledger = CGTLedger(self.starting_investment)
                 
         for year in range(1, self.years+1):
+
+            # Apply the tax rates in place for this year
+            fin_year = self.fin_year(year)
+            salary_tax = tax(self.salary, fin_year)
             
             # Annual Earnings
             dividend_income = self.current_investment * self.dp
 
             # Total Investment Value
             self.current_investment = (self.current_investment * (1 + self.dp)) * (1 + self.cg)
+            ledger.grow(self.cg)
             
             # If the shares are liquidated at the end of the investment period, factor in CGT
             if year == self.years and final_year_liquidation:
 
-                # Calculate taxable capital gains from DRP
-                cg_dividend = sum([self.taxable_capital_gains(x['dividend_income'], (self.years -  x['year'])) for x in growth_history])
-                cg_initial_investment = self.taxable_capital_gains(self.starting_investment, self.years)
-                total_cg = cg_dividend + cg_initial_investment
+                # Taxable capital gains from the initial investment & DRP
+                total_cg = ledger.taxable_capital_gains()
 
                 # Factor into annual income & net investment value
                 total_earnings = self.salary + dividend_income + total_cg
 
-                self.current_investment = self.current_investment - (tax(total_earnings) - self.salary_tax)
+                self.current_investment = self.current_investment - (tax(total_earnings, fin_year) - salary_tax)
 
             else:
                 total_earnings = self.salary + dividend_income
-                self.salary + dividend_income
 
             # Determine tax paid
-            tax_paid = tax(total_earnings)
-            excess_tax = tax_paid - self.salary_tax
+            tax_paid = tax(total_earnings, fin_year)
+            excess_tax = tax_paid - salary_tax
+
+            # Dividend is reinvested as a new parcel
+            ledger.buy(dividend_income)
 
             # Log outcome
-            growth_history.append(self.eoy_stats(
+            growth_history.append(
                 year = year,
                 salary = self.salary,
                 dividend_income = dividend_income,
                 excess_tax = excess_tax,
                 capital = self.current_investment
-                )
             )
 
         self.investment_history = growth_history
         self.summarised = self.__summarise(final_year_liquidation)
 
 
+    def liquidation_curve(self):
+        """Final position if everything were sold at the end of each year
+
+        Equivalent to running calculate_growth(final_year_liquidation=True) with each
+        possible number of years, but done in a single pass over the years.
+
+        Returns:
+            list: One dict per year containing:
+                - year: Year ID
+                - capital: Gross investment position before selling
+                - capital_gains: Taxable capital gains on selling
+                - liquidation_tax: Extra tax paid that year, including CGT
+                - final_position: Position after all excess tax paid to date
+        """
+
+        curve = []
+        investment = self.starting_investment
+        ledger = CGTLedger(self.starting_investment)
+        excess_tax_paid = 0
+
+        for year in range(1, self.years+1):
+            fin_year = self.fin_year(year)
+            salary_tax = tax(self.salary, fin_year)
+
+            dividend_income = investment * self.dp
+            investment = (investment * (1 + self.dp)) * (1 + self.cg)
+            ledger.grow(self.cg)
+
+            # Sell up now
+            capital_gains = ledger.taxable_capital_gains()
+            liquidation_tax = tax(self.salary + dividend_income + capital_gains, fin_year) - salary_tax
+
+            curve.append({
+                'year': year,
+                'capital': investment,
+                'capital_gains': capital_gains,
+                'liquidation_tax': liquidation_tax,
+                'final_position': round(investment - liquidation_tax - excess_tax_paid, 2)
+            })
+
+            # Or hold on for another year
+            excess_tax_paid += tax(self.salary + dividend_income, fin_year) - salary_tax
+            ledger.buy(dividend_income)
+
+        return curve
+
+
     def __summarise(self, final_year_liquidation=False):
         """Summarise the final position
                 
@@ -145,21 +302,23 @@ class GrowthCalculator:
             dict: Contains the summary stats
         """
 
+        history = self.investment_history
+
         # Total Tax
-        total_excess_tax_paid = sum([x['excess_tax'] for x in self.investment_history])
+        total_excess_tax_paid = float(history.column('excess_tax').sum())
 
         # Net Position
-        final_capital = self.investment_history[-1]['capital']
+        final_capital = float(history.column('capital')[-1])
 
         # Total Dividends
-        total_dividends = sum([x['dividend_income'] for x in self.investment_history])
+        total_dividends = float(history.column('dividend_income').sum())
 
         # Caculate Final Position
         # Note: If final_year_liquidation==True then don't double count the final year excess tax. It was taken into account above
         if not final_year_liquidation:
             final_position = round(final_capital - total_excess_tax_paid,2)
         else:
-            final_position = round(final_capital - total_excess_tax_paid + self.investment_history[-1]['excess_tax'],2)
+            final_position = round(final_capital - total_excess_tax_paid + float(history.column('excess_tax')[-1]),2)
 
 
         return {
@@ -168,3 +327,143 @@ class GrowthCalculator:
             'Total Capital': round(final_capital, 2),
             'Final Position': final_position, 
         }
+
+
+def simulate_growth_paths(salary, starting_investment, capital_growth, dividend_payout, years,
+                          final_year_liquidation=False, start_year=None):
+    """Vectorised core of the GrowthCalculator simulation
+
+    Every simulated year is computed for all scenarios in one step, with scenarios
+    shorter than the longest horizon held flat once they finish. Capital growth &
+    dividend payout may be given per scenario, or per scenario & year to simulate
+    varying returns.
+
+    Args:
+        salary (array-like): Salary for each scenario
+        starting_investment (array-like): Initial investment for each scenario
+        capital_growth (array-like): Capital growth % as a decimal. Shape (scenarios,) or (scenarios, years)
+        dividend_payout (array-like): Dividend payout % as a decimal. Shape (scenarios,) or (scenarios, years)
+        years (array-like): Years to simulate for each scenario
+        final_year_liquidation (bool, optional): Defaults to False. Sell everything in the final year & pay CGT
+        start_year (int, optional): Defaults to None. Financial year of the first simulated year,
+            otherwise the default tax rates (DEFAULT_FIN_YEAR) are used throughout
+
+    Returns:
+        dict: Arrays of summary stats, keyed as per GrowthCalculator.summarised
+    """
+
+    salary, starting_investment, years = np.broadcast_arrays(
+        np.asarray(salary, dtype=np.float64).reshape(-1),
+        np.asarray(starting_investment, dtype=np.float64).reshape(-1),
+        np.asarray(years, dtype=np.int64).reshape(-1),
+    )
+    n_years = int(years.max())
+
+    # Expand rates to scenario x year, column y-1 holding the rate for year y
+    capital_growth = np.asarray(capital_growth, dtype=np.float64)
+    dividend_payout = np.asarray(dividend_payout, dtype=np.float64)
+    if capital_growth.ndim < 2:
+        capital_growth = capital_growth.reshape(-1, 1)
+    if dividend_payout.ndim < 2:
+        dividend_payout = dividend_payout.reshape(-1, 1)
+
+    n_scenarios = max(salary.shape[0], capital_growth.shape[0], dividend_payout.shape[0])
+    salary, starting_investment, years = [np.broadcast_to(x, (n_scenarios,)) for x in (salary, starting_investment, years)]
+    capital_growth = np.broadcast_to(capital_growth, (n_scenarios, n_years))
+    dividend_payout = np.broadcast_to(dividend_payout, (n_scenarios, n_years))
+
+    # Scenario x year histories, with year 0 being the state pre investment
+    capital = np.empty((n_scenarios, n_years + 1))
+    dividend_income = np.zeros((n_scenarios, n_years + 1))
+    excess_tax = np.zeros((n_scenarios, n_years + 1))
+    capital[:, 0] = starting_investment
+
+    # Cost base of the initial investment & each reinvested dividend
+    ledger = CGTLedger(starting_investment.astype(np.float64))
+
+    for year in range(1, n_years + 1):
+        active = year <= years
+        fin_year = None if start_year is None else start_year + year - 1
+        salary_tax = tax_array(salary, fin_year)
+        cg = capital_growth[:, year - 1]
+        dp = dividend_payout[:, year - 1]
+
+        # Annual Earnings & Total Investment Value
+        dividend_income[:, year] = np.where(active, capital[:, year - 1] * dp, 0.0)
+        capital[:, year] = np.where(active, (capital[:, year - 1] * (1 + dp)) * (1 + cg), capital[:, year - 1])
+
+        total_earnings = salary + dividend_income[:, year]
+
+        # Scenarios ending this year are liquidated & pay CGT
+        liquidate = (years == year) if final_year_liquidation else np.zeros(n_scenarios, dtype=bool)
+        ledger.grow(cg)
+        if liquidate.any():
+            total_earnings[liquidate] += ledger.taxable_capital_gains()[liquidate]
+
+        # Determine tax paid
+        year_excess_tax = np.where(active, tax_array(total_earnings, fin_year) - salary_tax, 0.0)
+        excess_tax[:, year] = year_excess_tax
+        capital[liquidate, year] -= year_excess_tax[liquidate]
+        ledger.buy(dividend_income[:, year])
+
+    # Summarise the final position
+    total_excess_tax_paid = excess_tax.sum(axis=1)
+    final_capital = capital[np.arange(n_scenarios), years]
+    total_dividends = dividend_income.sum(axis=1)
+
+    # If liquidated, the final year excess tax was already taken from capital
+    final_position = final_capital - total_excess_tax_paid
+    if final_year_liquidation:
+        final_position += excess_tax[np.arange(n_scenarios), years]
+
+    return {
+        'Total Tax Paid': total_excess_tax_paid,
+        'Total Earnings': total_dividends,
+        'Total Capital': final_capital,
+        'Final Position': final_position,
+    }
+
+
+def calculate_growth_batch(salary, starting_investment, capital_growth, dividend_payout, years,
+                           final_year_liquidation=False, start_year=None):
+    """Runs the GrowthCalculator simulation for many scenarios at once
+
+    Parameters are broadcast against each other, so pass flattened grids
+    (eg, from numpy.meshgrid) to explore every combination.
+
+    Args:
+        salary (float or array-like): Salary for each scenario
+        starting_investment (float or array-like): Initial investment for each scenario
+        capital_growth (float or array-like): Capital growth % as a decimal
+        dividend_payout (float or array-like): Dividend payout % as a decimal
+        years (int or array-like): Years to simulate
+        final_year_liquidation (bool, optional): Defaults to False. Sell everything in the final year & pay CGT
+        start_year (int, optional): Defaults to None. Financial year of the first simulated year,
+            otherwise the default tax rates (DEFAULT_FIN_YEAR) are used throughout
+
+    Returns:
+        DataFrame: One row per scenario with its parameters & the GrowthCalculator summary stats
+    """
+
+    salary, starting_investment, capital_growth, dividend_payout, years = np.broadcast_arrays(
+        np.asarray(salary, dtype=np.float64).reshape(-1),
+        np.asarray(starting_investment, dtype=np.float64).reshape(-1),
+        np.asarray(capital_growth, dtype=np.float64).reshape(-1),
+        np.asarray(dividend_payout, dtype=np.float64).reshape(-1),
+        np.asarray(years, dtype=np.int64).reshape(-1),
+    )
+
+    summary = simulate_growth_paths(salary, starting_investment, capital_growth, dividend_payout, years,
+                                    final_year_liquidation, start_year)
+
+    df = pd.DataFrame({
+        'salary': salary,
+        'starting_investment': starting_investment,
+        'capital_growth': capital_growth,
+        'dividend_payout': dividend_payout,
+        'years': years,
+    })
+    for field, values in summary.items():
+        df[field] = np.round(values, 2)
+
+    return df
@@ -0,0 +1,141 @@
+"""
+Title: Monte Carlo Growth Simulator
+Description: Runs the growth simulator over many randomly drawn return paths
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from GrowthCalculator import simulate_growth_paths
+
+
+class NormalReturns:
+    """Draws each year's capital growth & dividend payout from independent normal distributions
+
+    Capital growth is floored at -100% since a holding can't lose more than its value, &
+    dividend payouts are floored at zero since a company can't pay a negative dividend.
+    """
+
+    def __init__(self, capital_growth_mean, capital_growth_std, dividend_payout_mean, dividend_payout_std=0.0):
+        self.capital_growth_mean = capital_growth_mean
+        self.capital_growth_std = capital_growth_std
+        self.dividend_payout_mean = dividend_payout_mean
+        self.dividend_payout_std = dividend_payout_std
+
+    def sample(self, rng, n_paths, n_years):
+        """Generates return paths
+
+        Args:
+            rng (numpy.random.Generator): Random number generator
+            n_paths (int): Number of paths
+            n_years (int): Years per path
+
+        Returns:
+            numpy.ndarray, numpy.ndarray: Capital growth & dividend payout, each paths x years
+        """
+
+        capital_growth = rng.normal(self.capital_growth_mean, self.capital_growth_std, (n_paths, n_years))
+        dividend_payout = rng.normal(self.dividend_payout_mean, self.dividend_payout_std, (n_paths, n_years))
+
+        return np.maximum(capital_growth, -1.0), np.maximum(dividend_payout, 0.0)
+
+
+class BootstrapReturns:
+    """Resamples whole years, with replacement, from a historical return series
+
+    Capital growth & dividend payout are drawn from the same historical year so
+    any relationship between the two is kept.
+    """
+
+    def __init__(self, capital_growth, dividend_payout):
+        self.capital_growth = np.asarray(capital_growth, dtype=np.float64)
+        self.dividend_payout = np.asarray(dividend_payout, dtype=np.float64)
+
+        if self.capital_growth.shape != self.dividend_payout.shape or self.capital_growth.ndim != 1:
+            raise ValueError("Please provide one capital growth & dividend payout for each historical year")
+
+    def sample(self, rng, n_paths, n_years):
+        """Generates return paths
+
+        Args:
+            rng (numpy.random.Generator): Random number generator
+            n_paths (int): Number of paths
+            n_years (int): Years per path
+
+        Returns:
+            numpy.ndarray, numpy.ndarray: Capital growth & dividend payout, each paths x years
+        """
+
+        picks = rng.integers(0, self.capital_growth.shape[0], (n_paths, n_years))
+
+        return self.capital_growth[picks], self.dividend_payout[picks]
+
+
+def _simulate_chunk(seed, n_paths, returns, salary, starting_investment, years, final_year_liquidation, start_year):
+    """Simulates a single chunk of paths. Runs inside the worker processes"""
+
+    rng = np.random.default_rng(seed)
+    capital_growth, dividend_payout = returns.sample(rng, n_paths, years)
+
+    summary = simulate_growth_paths(salary, starting_investment, capital_growth, dividend_payout, years,
+                                    final_year_liquidation, start_year)
+
+    return summary['Final Position'], summary['Total Tax Paid']
+
+
+def monte_carlo_growth(salary, starting_investment, years, returns, n_paths=10000, chunk_size=10000,
+                       percentiles=(5, 25, 50, 75, 95), final_year_liquidation=False, start_year=None,
+                       seed=None, processes=None):
+    """Simulates the final position over many random return paths
+
+    Paths are generated & simulated in chunks so only one chunk of return paths is
+    held in memory per worker. Each chunk gets its own seed spawned from the seed
+    provided, so results are reproducible regardless of how many processes are used.
+
+    Args:
+        salary (float): Annual salary
+        starting_investment (float): Initial investment
+        years (int): Years to simulate
+        returns (NormalReturns or BootstrapReturns): Model used to draw each path's returns
+        n_paths (int, optional): Defaults to 10000. Number of paths to simulate
+        chunk_size (int, optional): Defaults to 10000. Paths simulated at once by a worker
+        percentiles (tuple, optional): Defaults to (5, 25, 50, 75, 95). Percentile bands to report
+        final_year_liquidation (bool, optional): Defaults to False. Sell everything in the final year & pay CGT
+        start_year (int, optional): Defaults to None. Financial year of the first simulated year
+        seed (int, optional): Defaults to None. Seed for reproducible results
+        processes (int, optional): Defaults to None, being one per cpu. Use 1 to run in this process
+
+    Returns:
+        DataFrame: Final position & total tax paid at each percentile
+    """
+
+    if n_paths < 1:
+        raise ValueError("Please provide at least one path to simulate")
+
+    chunks = [min(chunk_size, n_paths - start) for start in range(0, n_paths, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    args = [
+        (chunk_seed, chunk_paths, returns, salary, starting_investment, years, final_year_liquidation, start_year)
+        for chunk_seed, chunk_paths in zip(seeds, chunks)
+    ]
+
+    processes = processes or os.cpu_count()
+    if processes == 1 or len(chunks) == 1:
+        results = [_simulate_chunk(*x) for x in args]
+    else:
+        with ProcessPoolExecutor(max_workers=min(processes, len(chunks))) as pool:
+            results = list(pool.map(_simulate_chunk, *zip(*args)))
+
+    final_position = np.concatenate([x[0] for x in results])
+    tax_paid = np.concatenate([x[1] for x in results])
+
+    return pd.DataFrame(
+        {
+            'Final Position': np.percentile(final_position, percentiles),
+            'Total Tax Paid': np.percentile(tax_paid, percentiles),
+        },
+        index=pd.Index(percentiles, name='percentile'),
+    )
@@ -3,6 +3,14 @@ Title: Australian Tax Calculator
 Desc:  Calculates tax owed given factors such as franking, deductions, etc
 """
 
+import json
+import os
+from bisect import bisect_right
+from datetime import datetime
+from functools import lru_cache
+from types import MappingProxyType
+
+import numpy as np
 
 
 # class AusTax():
@@ -21,49 +29,304 @@ Desc:  Calculates tax owed given factors such as franking, deductions, etc
 
 
 
+# Tax rates (%'s) & corresponding income thresholds for each fin year
+TAX_RATES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tax_rates.json")
+
+# Number of (income, fin year) results remembered by tax()
+TAX_CACHE_SIZE = 4096
+
+# Financial year used when none is given. Kept at FY2019, the most recent year tax() had
+# before the schedules moved to tax_rates.json, so default results don't change as years are added
+DEFAULT_FIN_YEAR = 2019
+
+
+class TaxSchedule:
+    """Precompiled progressive tax brackets for a single financial year
+
+    The tax owed at each threshold is accumulated once up front, so working out
+    the tax on any income is a bracket lookup plus one multiply-add rather than
+    a walk over every band.
+    """
+
+    __slots__ = ("tax_rates", "income_thresholds", "cumulative_tax",
+                 "_rates", "_thresholds", "_cumulative")
+
+    def __init__(self, tax_rates, income_thresholds):
+        if len(tax_rates) != len(income_thresholds):
+            raise ValueError("Please provide a tax rate for each income threshold")
+
+        self.tax_rates = tuple(tax_rates)
+        self.income_thresholds = tuple(income_thresholds)
+
+        # Tax owed on all income up to each threshold. Summed band by band in
+        # the same order as the original calculator so results match exactly
+        cumulative_tax = [0]
+        for rate, lower, upper in zip(self.tax_rates, self.income_thresholds, self.income_thresholds[1:]):
+            cumulative_tax.append(cumulative_tax[-1] + rate * (upper - lower))
+        self.cumulative_tax = tuple(cumulative_tax)
+
+        self._rates = np.array(self.tax_rates, dtype=np.float64)
+        self._thresholds = np.array(self.income_thresholds, dtype=np.float64)
+        self._cumulative = np.array(self.cumulative_tax, dtype=np.float64)
+
+        # Schedules are shared & cached against, so lock them down
+        for array in (self._rates, self._thresholds, self._cumulative):
+            array.flags.writeable = False
+
+    def tax(self, income):
+        """Calculates progressive tax owed
+
+        Args:
+            income (float or array-like): Net income/s for the tax year
+
+        Returns:
+            float or numpy.ndarray: Gross tax owed, matching the shape of income
+        """
+
+        # Scalars skip numpy entirely, it's slower than bisect for a single value
+        if isinstance(income, (int, float)) or np.ndim(income) == 0:
+            return self.tax_scalar(income)
+
+        income = np.asarray(income, dtype=np.float64)
+        band = np.searchsorted(self._thresholds, income, side="right") - 1
+
+        # Anything below the first threshold owes nothing
+        below = band < 0
+        band[below] = 0
+        owed = self._cumulative[band] + self._rates[band] * (income - self._thresholds[band])
+        owed[below] = 0.0
+
+        return owed
+
+    def tax_scalar(self, income):
+        """Calculates progressive tax owed on a single income, without any type checks
+
+        Args:
+            income (float): Net income for the tax year
+
+        Returns:
+            float: Gross tax owed
+        """
+
+        band = bisect_right(self.income_thresholds, income) - 1
+        if band < 0:
+            return 0.0
+        return self.cumulative_tax[band] + self.tax_rates[band] * (income - self.income_thresholds[band])
+
+    __call__ = tax
+
+    def __setattr__(self, name, value):
+        if hasattr(self, "_cumulative"):
+            raise AttributeError("TaxSchedule is immutable")
+        object.__setattr__(self, name, value)
+
+    def __repr__(self):
+        return "TaxSchedule(tax_rates={}, income_thresholds={})".format(
+            list(self.tax_rates), list(self.income_thresholds))
+
+
+class TaxScheduleRegistry:
+    """Read-only collection of tax schedules keyed by financial year
+
+    A year without its own entry falls back to the most recent schedule before it,
+    so years past the end of the data keep using the latest known rates. Years before
+    the earliest schedule use the earliest schedule.
+    """
+
+    def __init__(self, schedules, default_year=None):
+        """
+        Args:
+            schedules (dict): TaxSchedule for each financial year
+            default_year (int, optional): Defaults to None, being the most recent year.
+                Financial year used when none is given
+        """
+
+        if len(schedules) == 0:
+            raise ValueError("Please provide at least one tax schedule")
+
+        self._schedules = MappingProxyType(dict(sorted((int(fy), s) for fy, s in schedules.items())))
+        self._years = tuple(self._schedules.keys())
+        self.default_year = self._years[-1] if default_year is None else self.resolve_year(default_year)
+
+    @classmethod
+    def from_file(cls, path=TAX_RATES_FILE, default_year=None):
+        """Loads schedules from a json file of the form
+        {"2019": {"tax_rates": [...], "income_thresholds": [...]}, ...}
+
+        Args:
+            path (str, optional): Defaults to the tax_rates.json shipped alongside this module
+            default_year (int, optional): Defaults to None, being the most recent year.
+                Financial year used when none is given
+
+        Returns:
+            TaxScheduleRegistry: Compiled schedules
+        """
+
+        with open(path) as f:
+            fy_tax_rates = json.load(f)
+
+        return cls({
+            fy: TaxSchedule(rates["tax_rates"], rates["income_thresholds"])
+            for fy, rates in fy_tax_rates.items()
+        }, default_year)
+
+    @property
+    def years(self):
+        return self._years
+
+    @property
+    def latest_year(self):
+        return self._years[-1]
+
+    def resolve_year(self, fin_year=None) -> int:
+        """Finds the financial year whose schedule applies
+
+        Args:
+            fin_year (int, optional): Defaults to None, being the registry's default year
+
+        Returns:
+            int: Financial year with a schedule on file
+        """
+
+        if fin_year is None:
+            return self.default_year
+
+        fin_year = int(fin_year)
+        if fin_year in self._schedules:
+            return fin_year
+
+        # Years before the data starts use the earliest schedule on file
+        return self._years[max(bisect_right(self._years, fin_year) - 1, 0)]
+
+    def schedule(self, fin_year=None) -> TaxSchedule:
+        """Fetches the schedule applicable to a financial year
+
+        Args:
+            fin_year (int, optional): Defaults to None, being the registry's default year
+
+        Returns:
+            TaxSchedule: Brackets for that financial year
+        """
+
+        return self._schedules[self.resolve_year(fin_year)]
+
+    def for_date(self, date) -> TaxSchedule:
+        """Fetches the schedule applicable on a given date
+
+        Args:
+            date (datetime.date or str): Date of interest. Strings must be YYYY-MM-DD
+
+        Returns:
+            TaxSchedule: Brackets for the financial year containing that date
+        """
+
+        return self.schedule(financial_year(date))
+
+    def __getitem__(self, fin_year):
+        return self.schedule(fin_year)
+
+    def __contains__(self, fin_year):
+        return int(fin_year) in self._schedules
+
+    def __iter__(self):
+        return iter(self._years)
+
+    def __len__(self):
+        return len(self._years)
+
+
+TAX_SCHEDULES = TaxScheduleRegistry.from_file(default_year=DEFAULT_FIN_YEAR)
+
+
+def financial_year(date) -> int:
+    """Financial year a date falls in, using the latter year as the identifier
+
+    Eg, 2018-03-01 -> 2018 and 2018-07-01 -> 2019
+
+    Args:
+        date (datetime.date or str): Date of interest. Strings must be YYYY-MM-DD
+
+    Returns:
+        int: Financial year
+    """
+
+    if isinstance(date, str):
+        date = datetime.strptime(date, "%Y-%m-%d")
+
+    return date.year + 1 if date.month >= 7 else date.year
+
+
+def tax_schedule(fin_year: int = None) -> TaxSchedule:
+    """Fetches the precompiled tax schedule for a financial year
+
+    Args:
+        fin_year (int, optional): Defaults to None.
+                Financial year of interest, with the latter year being the identifier
+                eg, fy 2017/18 is represented as 2018. If not provided DEFAULT_FIN_YEAR is used
+
+    Returns:
+        TaxSchedule: Brackets for that financial year
+    """
+
+    return TAX_SCHEDULES.schedule(fin_year)
+
+
+def tax_array(income, fin_year=None) -> np.ndarray:
+    """Calculates progressive tax owed for many incomes at once
+
+    Args:
+        income (float or array-like): Net income/s for the tax year
+        fin_year (int or array-like, optional): Defaults to None.
+                Financial year/s of interest. Either a single year applied to all incomes
+                or one year per income. If not provided DEFAULT_FIN_YEAR is used
+
+    Returns:
+        numpy.ndarray: Gross tax owed for each income
+    """
+
+    income = np.asarray(income, dtype=np.float64)
+
+    if fin_year is None or np.ndim(fin_year) == 0:
+        return np.asarray(tax_schedule(fin_year).tax(income.reshape(-1))).reshape(income.shape)
+
+    # Evaluate each financial year's incomes in a single pass
+    income, fin_year = np.broadcast_arrays(income, np.asarray(fin_year))
+    owed = np.empty(income.shape, dtype=np.float64)
+    for fy in np.unique(fin_year):
+        in_year = fin_year == fy
+        owed[in_year] = tax_schedule(fy).tax(income[in_year])
+
+    return owed
+
+
 def tax(income: int, fin_year: int = None) -> float:
     """Calculates progressive tax owed 
     
     Args:
-        income (int): Net income for the tax year
+        income (int or array-like): Net income for the tax year
         fin_year (int, optional): Defaults to None.
                 Financial year of interest, with the latter year being the identifier
-                eg, fy 2017/18 is represented as 2018
+                eg, fy 2017/18 is represented as 2018. If not provided DEFAULT_FIN_YEAR is used.
+                Years before the earliest schedule on file (FY2013) use the earliest schedule
     
     Returns:
-        float: Gross tax owed
+        float: Gross tax owed, or numpy.ndarray if given many incomes
     """
 
-    # Define tax rates (%'s) & corresponding income thresholds for fin years
-    fy_tax_rates = {
-        "2019":{
-            "tax_rates": [0,0.19,0.325,0.37,0.45],
-            "income_thresholds": [0, 18200, 37000, 90000, 180000]
-        },
-        "2018":{
-            "tax_rates": [0,0.19,0.325,0.37,0.45],
-            "income_thresholds": [0, 18200, 37000, 87000, 180000]
-        }
-    }
-
-    # Assign appropriate tax rates
-    # If no financial year is provided, select the most recent
-    if fin_year is None:
-        fin_year = max(fy_tax_rates.keys())
+    # Single incomes are the hot path, so they're checked first & remembered as given
+    if isinstance(income, (int, float)):
+        return _cached_tax(income, fin_year)
 
-    tax_rates = fy_tax_rates[fin_year]['tax_rates']
-    income_thresholds = fy_tax_rates[fin_year]['income_thresholds']
+    # Arrays go straight to the schedule
+    if isinstance(income, np.ndarray) or np.ndim(income) > 0:
+        return TAX_SCHEDULES.schedule(fin_year).tax(income)
 
-    # This ensures the upport most tax bracket is calculated
-    income_thresholds.append(income)
+    return _cached_tax(income, fin_year)
 
-    # Divy up salaray based off tax bands
-    income_by_band = []
-    for lower, upper in zip(income_thresholds, income_thresholds[1:]):
-        income_by_band.append(max(min(upper-lower, income - lower),0))
 
-    # Calculate progressive tax owed
-    return sum([a*b for a,b in zip(tax_rates,income_by_band)])
+@lru_cache(maxsize=TAX_CACHE_SIZE)
+def _cached_tax(income, fin_year):
+    return TAX_SCHEDULES.schedule(fin_year).tax_scalar(income)
 
 
 def franked_dividends(dividend: float, franking: float = 1.0, corporate_tax_rate: float = 0.3):
@@ -97,3 +360,79 @@ def franked_dividends(dividend: float, franking: float = 1.0, corporate_tax_rate
     pre_tax_dividend = dividend + franking_credits
 
     return pre_tax_dividend, franking_credits
+
+
+class CGTLedger:
+    """Running cost base of an investment built up from yearly parcels
+
+    Rather than tracking every parcel, parcels are pooled by whether they've been held
+    long enough for the 50% CGT discount. Each pool stores its total cost and its
+    size in units of a price index, so the gain on any pool at the current price is
+    a single multiply. Updating the ledger each year and asking for the taxable gain
+    are both O(1), regardless of how many parcels have been bought.
+
+    Works on floats, or numpy arrays to track many scenarios at once.
+
+    Yearly usage:
+        1. grow() by that year's capital growth
+        2. taxable_capital_gains() if selling up this year
+        3. buy() any parcel acquired this year, eg a reinvested dividend
+    """
+
+    def __init__(self, initial_investment):
+        self.price = 1.0
+        self.discount_units = 0.0
+        self.discount_cost = 0.0
+        self.recent_units = initial_investment
+        self.recent_cost = initial_investment
+
+    def grow(self, capital_growth):
+        """Applies a year of capital growth to every parcel held
+
+        Args:
+            capital_growth (float or numpy.ndarray): Capital growth % as a decimal
+        """
+
+        self.price = self.price * (1 + capital_growth)
+
+    def buy(self, cost):
+        """Ages the parcel bought last year into the discount pool & buys a new one
+
+        Args:
+            cost (float or numpy.ndarray): Purchase cost of the new parcel
+        """
+
+        self._restart_wiped_out()
+
+        self.discount_units = self.discount_units + self.recent_units
+        self.discount_cost = self.discount_cost + self.recent_cost
+        self.recent_units = cost / self.price
+        self.recent_cost = cost
+
+    def _restart_wiped_out(self):
+        """Restarts the price index at 1 once a holding's fallen to a price of 0
+
+        The units held are worthless from then on, so they're dropped & their cost left
+        as a capital loss. Without this, parcels bought later would be divided by 0.
+        """
+
+        if isinstance(self.price, np.ndarray):
+            wiped_out = self.price == 0
+            if wiped_out.any():
+                self.discount_units = np.where(wiped_out, 0.0, self.discount_units)
+                self.recent_units = np.where(wiped_out, 0.0, self.recent_units)
+                self.price = np.where(wiped_out, 1.0, self.price)
+        elif self.price == 0:
+            self.discount_units, self.recent_units, self.price = 0.0, 0.0, 1.0
+
+    def taxable_capital_gains(self):
+        """Taxable capital gains if everything was sold at the current price
+
+        Returns:
+            float or numpy.ndarray: Taxable component of capital gains
+        """
+
+        discount_gain = self.discount_units * self.price - self.discount_cost
+        recent_gain = self.recent_units * self.price - self.recent_cost
+
+        return discount_gain / 2 + recent_gain
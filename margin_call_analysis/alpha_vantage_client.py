@@ -0,0 +1,237 @@
+"""
+Title: Alpha Vantage Client
+Description: Shared, rate limited & cached access to the Alpha Vantage time series endpoints
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import count, span
+
+
+class TokenBucket:
+    """Thread safe token bucket limiting requests to a fixed number per period
+
+    Up to `rate` requests can go straight through, after which callers block
+    until tokens refill at rate/period per second.
+    """
+
+    def __init__(self, rate, period=60.0):
+        """
+        Args:
+            rate (int): Requests allowed per period
+            period (float, optional): Defaults to 60. Length of the period in seconds
+        """
+
+        self.rate = rate
+        self.period = period
+        self._tokens = float(rate)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a request is allowed"""
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._last_refill) * self.rate / self.period)
+                self._last_refill = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait = (1 - self._tokens) * self.period / self.rate
+
+            time.sleep(wait)
+
+
+class TTLCache:
+    """Thread safe least recently used cache whose entries expire after a fixed time"""
+
+    def __init__(self, maxsize=256, ttl=86400):
+        """
+        Args:
+            maxsize (int, optional): Defaults to 256. Entries kept before the least recently used is evicted
+            ttl (float, optional): Defaults to 86400 (a day). Seconds an entry stays valid
+        """
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Fetches an entry
+
+        Args:
+            key (hashable): Entry key
+
+        Returns:
+            object: Cached value, or None if missing or expired
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expiry, value = entry
+            if time.monotonic() >= expiry:
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        """Stores an entry, evicting the least recently used if full
+
+        Args:
+            key (hashable): Entry key
+            value (object): Value to cache
+        """
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class AlphaVantageClient:
+    """One TimeSeries client shared between requests, kept under the api quota
+
+    Requests wait on a token bucket sized to the quota, & responses are cached so
+    repeat requests for a symbol never go back to the network.
+    """
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, key, requests_per_period=5, period=60.0, cache_ttl=86400, cache_size=256, timeseries=None):
+        """
+        Args:
+            key (str): alphavantage api key
+            requests_per_period (int, optional): Defaults to 5. Requests allowed by the quota each period
+            period (float, optional): Defaults to 60. Quota period in seconds
+            cache_ttl (float, optional): Defaults to 86400 (a day). Seconds to reuse a response for
+            cache_size (int, optional): Defaults to 256. Responses kept in the cache
+            timeseries (TimeSeries, optional): Defaults to None. Client to use instead of creating one
+        """
+
+        if timeseries is None:
+            # Imported here so it's only loaded by code that actually talks to Alpha Vantage
+            from alpha_vantage.timeseries import TimeSeries
+
+            timeseries = TimeSeries(key=key, output_format="pandas", indexing_type="integer")
+
+        self.ts = timeseries
+        self.bucket = TokenBucket(requests_per_period, period)
+        self.cache = TTLCache(cache_size, cache_ttl)
+
+        # Stops concurrent requests for the same data each going to the network. Each
+        # entry is a lock & the number of callers using it, removed once that reaches 0
+        self._request_locks = {}
+        self._request_locks_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, key):
+        """Client shared by everything using an api key, created on first use
+
+        Args:
+            key (str): alphavantage api key
+
+        Returns:
+            AlphaVantageClient: Shared client
+        """
+
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(key)
+
+            return cls._shared[key]
+
+    def _fetch(self, time_slice, symbol):
+        # Checked before taking a token, so a bad request doesn't use up the quota
+        if time_slice not in ("daily", "weekly", "monthly"):
+            raise ValueError(
+                "Please provide a valid time slice. The options are daily, weekly or monthly"
+            )
+
+        with span("alpha_vantage.rate_limit_wait"):
+            self.bucket.acquire()
+
+        with span("alpha_vantage.fetch"):
+            if time_slice == "daily":
+                df, metadata = self.ts.get_daily(symbol, outputsize="full")
+            elif time_slice == "weekly":
+                df, metadata = self.ts.get_weekly(symbol)
+            else:
+                df, metadata = self.ts.get_monthly(symbol)
+
+        count("alpha_vantage.rows_parsed", len(df))
+        return df
+
+    def get(self, time_slice, symbol):
+        """Retrieves raw EOD data, from the cache where possible
+
+        Args:
+            time_slice (str): Aggregate level to fetch. Options are:
+                - daily
+                - weekly
+                - monthly
+            symbol (str): Symbol used, including the exchange
+
+        Returns:
+            DataFrame: EOD dataframe as returned by alpha_vantage. A copy, so safe to modify
+        """
+
+        request = (time_slice, symbol)
+
+        with self._request_locks_lock:
+            entry = self._request_locks.setdefault(request, [threading.Lock(), 0])
+            entry[1] += 1
+
+        try:
+            with entry[0]:
+                df = self.cache.get(request)
+                if df is None:
+                    count("alpha_vantage.cache_misses")
+                    df = self._fetch(time_slice, symbol)
+                    self.cache.put(request, df)
+                else:
+                    count("alpha_vantage.cache_hits")
+        finally:
+            with self._request_locks_lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._request_locks[request]
+
+        return df.copy()
+
+    def get_many(self, symbols, time_slice, max_workers=4):
+        """Retrieves raw EOD data for many symbols, queued under the quota
+
+        Args:
+            symbols (list): Symbols used, including the exchange
+            time_slice (str): daily, weekly or monthly
+            max_workers (int, optional): Defaults to 4. Requests in flight at once
+
+        Returns:
+            dict: EOD dataframe for each symbol
+        """
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return dict(zip(symbols, pool.map(lambda symbol: self.get(time_slice, symbol), symbols)))
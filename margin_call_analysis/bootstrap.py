@@ -0,0 +1,124 @@
+"""
+Title: Block Bootstrap Margin Call Estimator
+Desc:  Estimates margin call probabilities from synthetic price paths resampled from history
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from statistics import NormalDist
+
+import numpy as np
+
+from drawdown import rolling_max
+from helpers import count_margin_calls
+
+
+# Historical returns, attached from shared memory in each worker process
+_returns = None
+_returns_shm = None
+
+
+def _attach_returns(name, length):
+    """Worker initialiser, maps the parent's return array without copying it"""
+
+    global _returns, _returns_shm
+
+    _returns_shm = shared_memory.SharedMemory(name=name)
+    _returns = np.ndarray((length,), dtype=np.float64, buffer=_returns_shm.buf)
+
+
+def _simulate_chunk(seed, n_paths, horizon, block_size, drawdown_window, mc_triggers, returns=None):
+    """Generates a chunk of block bootstrapped paths & counts the paths margin called at each trigger"""
+
+    returns = _returns if returns is None else returns
+    rng = np.random.default_rng(seed)
+
+    # Stitch together randomly chosen blocks of consecutive historical returns
+    n_blocks = -(-horizon // block_size)
+    starts = rng.integers(0, len(returns) - block_size + 1, (n_paths, n_blocks))
+    picks = (starts[:, :, np.newaxis] + np.arange(block_size)).reshape(n_paths, -1)[:, :horizon]
+
+    # Price paths starting from 1
+    log_prices = np.zeros((n_paths, horizon + 1))
+    np.cumsum(returns[picks], axis=1, out=log_prices[:, 1:])
+    prices = np.exp(log_prices)
+
+    # A path is margin called at an LVR if its worst drawdown passes the trigger
+    worst_drawdown = ((prices / rolling_max(prices, drawdown_window)).min(axis=1) - 1.0) * 100
+
+    return count_margin_calls(worst_drawdown, mc_triggers)
+
+
+def block_bootstrap_margin_calls(prices, lvr_lookup, drawdown_window=None, n_paths=10000, block_size=20,
+                                 horizon=None, chunk_size=250, confidence=0.95, seed=None, processes=None):
+    """Estimates the probability of a margin call at each LVR
+
+    Log returns from the price history are resampled in blocks of consecutive bars,
+    keeping short term volatility clustering, to build many synthetic price paths.
+    The return array is put in shared memory once & read by every worker, with each
+    worker generating paths a chunk at a time to keep memory bounded.
+
+    Args:
+        prices (pandas.Series or array-like): Price history, eg the Close column from get_yahoo_history
+        lvr_lookup (data.frame): Lookup table with LVRs & their corresponding margin call trigger
+        drawdown_window (int, optional): Defaults to None. Bars to measure drawdown over. None for the path's high
+        n_paths (int, optional): Defaults to 10000. Number of synthetic paths
+        block_size (int, optional): Defaults to 20. Consecutive bars per resampled block
+        horizon (int, optional): Defaults to None, being the length of the history. Bars per path
+        chunk_size (int, optional): Defaults to 250. Paths generated at once by a worker
+        confidence (float, optional): Defaults to 0.95. Confidence level of the intervals
+        seed (int, optional): Defaults to None. Seed for reproducible results
+        processes (int, optional): Defaults to None, being one per cpu. Use 1 to run in this process
+
+    Returns:
+        data.frame: Lookup table with margin call probability & its confidence interval appended
+    """
+
+    if n_paths < 1:
+        raise ValueError("Please provide at least one path to simulate")
+
+    prices = np.asarray(prices, dtype=np.float64)
+    prices = prices[np.isfinite(prices) & (prices > 0)]
+    returns = np.diff(np.log(prices))
+
+    horizon = len(returns) if horizon is None else horizon
+    if block_size > len(returns):
+        raise ValueError("Please provide a block size no longer than the price history")
+
+    mc_triggers = lvr_lookup["mc_trigger"].to_numpy(dtype=np.float64)
+
+    # Each chunk gets its own seed so results don't depend on the number of processes
+    chunks = [min(chunk_size, n_paths - start) for start in range(0, n_paths, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    args = [(chunk_seed, chunk_paths, horizon, block_size, drawdown_window, mc_triggers)
+            for chunk_seed, chunk_paths in zip(seeds, chunks)]
+
+    processes = processes or os.cpu_count()
+    if processes == 1 or len(chunks) == 1:
+        counts = sum(_simulate_chunk(*x, returns=returns) for x in args)
+    else:
+        shm = shared_memory.SharedMemory(create=True, size=returns.nbytes)
+        try:
+            np.ndarray(returns.shape, dtype=np.float64, buffer=shm.buf)[:] = returns
+
+            with ProcessPoolExecutor(max_workers=min(processes, len(chunks)), initializer=_attach_returns,
+                                     initargs=(shm.name, len(returns))) as pool:
+                counts = sum(pool.map(_simulate_chunk, *zip(*args)))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    # Wilson score interval, which behaves near probabilities of 0 & 1
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    probability = counts / n_paths
+    centre = (probability + z ** 2 / (2 * n_paths)) / (1 + z ** 2 / n_paths)
+    half_width = z * np.sqrt(probability * (1 - probability) / n_paths + z ** 2 / (4 * n_paths ** 2)) / (1 + z ** 2 / n_paths)
+
+    df = lvr_lookup[["lvr", "mc_trigger"]].copy()
+    df["mc_paths"] = counts
+    df["mc_probability"] = probability
+    df["ci_lower"] = np.where(counts == 0, 0.0, np.maximum(centre - half_width, 0.0))
+    df["ci_upper"] = np.where(counts == n_paths, 1.0, np.minimum(centre + half_width, 1.0))
+
+    return df
@@ -0,0 +1,510 @@
+"""
+Title: Drawdown Engines
+Desc:  Fast drawdown calculations for many windows, live bars & entry dates
+"""
+
+import math
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+class RangeMaxIndex:
+    """Sparse table answering "max price between bars i & j" in O(1)
+
+    Level k holds the max of every run of 2^k bars, so any range is covered by two
+    overlapping runs from the same level. Building costs O(N log N) once, after which
+    a rolling max for any window is a couple of gathers. NaNs are ignored, as per
+    pandas' rolling max.
+    """
+
+    def __init__(self, values):
+        """
+        Args:
+            values (array-like): Price series
+        """
+
+        values = np.asarray(values, dtype=np.float64)
+        n = len(values)
+        n_levels = max(int(np.log2(n)) + 1, 1) if n > 0 else 1
+
+        self.table = np.full((n_levels, n), np.nan)
+        self.table[0] = values
+        for k in range(1, n_levels):
+            half = 1 << (k - 1)
+            span = 1 << k
+            self.table[k, : n - span + 1] = np.fmax(self.table[k - 1, : n - span + 1], self.table[k - 1, half : n - half + 1])
+
+        # Level to use for a range of each length, indexed by length
+        self._level = np.zeros(n + 1, dtype=np.int64)
+        if n > 0:
+            self._level[1:] = np.floor(np.log2(np.arange(1, n + 1))).astype(np.int64)
+
+    def __len__(self):
+        return self.table.shape[1]
+
+    def range_max(self, start, end):
+        """Max of each inclusive range [start, end]
+
+        Args:
+            start (array-like): First bar of each range
+            end (array-like): Last bar of each range
+
+        Returns:
+            numpy.ndarray: Max over each range
+        """
+
+        start = np.asarray(start, dtype=np.int64)
+        end = np.asarray(end, dtype=np.int64)
+
+        level = self._level[end - start + 1]
+        return np.fmax(self.table[level, start], self.table[level, end - (1 << level) + 1])
+
+    def rolling_max(self, window_size=None):
+        """Max of each bar & the window_size - 1 bars before it
+
+        Args:
+            window_size (int, optional): Defaults to None. Bars to look back over. None for all bars to date
+
+        Returns:
+            numpy.ndarray: Rolling max, matching pandas' rolling(window_size, min_periods=1).max()
+        """
+
+        n = len(self)
+        if window_size is None or window_size >= n:
+            return np.fmax.accumulate(self.table[0])
+
+        end = np.arange(n)
+        return self.range_max(np.maximum(end - window_size + 1, 0), end)
+
+
+def drawdown_matrix(prices, window_sizes):
+    """Drawdown of every bar for many look back windows at once
+
+    Args:
+        prices (pandas.Series or array-like): Price history
+        window_sizes (list): Windows to calculate. Use None for drawdown from the all time high
+
+    Returns:
+        data.frame: Bars x windows drawdowns, as percentages in the style of calc_drawdown
+    """
+
+    index = prices.index if isinstance(prices, pd.Series) else None
+    prices = np.asarray(prices, dtype=np.float64)
+    range_max = RangeMaxIndex(prices)
+
+    drawdowns = np.empty((len(prices), len(window_sizes)))
+    # A zero price with no higher price in its window is 0/0, left as NaN like calc_drawdown
+    with np.errstate(invalid="ignore"):
+        for i, window_size in enumerate(window_sizes):
+            drawdowns[:, i] = (prices / range_max.rolling_max(window_size) - 1.0) * 100
+
+    # As per calc_drawdown, a zero price is bad data rather than a total loss
+    drawdowns[drawdowns == -100] = 0
+
+    columns = ["all" if x is None else x for x in window_sizes]
+    return pd.DataFrame(drawdowns, index=index, columns=pd.Index(columns, name="window"))
+
+
+def rolling_max(values, window_size=None):
+    """Rolling max along the last axis, for many series at once
+
+    Windows are built up by doubling, so a window of w bars takes O(log w) passes.
+    NaNs are ignored, as per pandas' rolling(window_size, min_periods=1).max().
+
+    Args:
+        values (numpy.ndarray): Series to roll over, eg paths x bars
+        window_size (int, optional): Defaults to None. Bars to look back over. None for all bars to date
+
+    Returns:
+        numpy.ndarray: Rolling max, same shape as values
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    n = values.shape[-1]
+    if window_size is None or window_size >= n:
+        return np.fmax.accumulate(values, axis=-1)
+
+    def fmax_shifted(x, shift):
+        out = x.copy()
+        out[..., shift:] = np.fmax(x[..., shift:], x[..., :-shift])
+        return out
+
+    # Max over the last `span` bars, doubling span while it fits in the window
+    out = values
+    span = 1
+    while span * 2 <= window_size:
+        out = fmax_shifted(out, span)
+        span *= 2
+
+    # Overlapping the last two spans covers the remainder
+    if span < window_size:
+        out = fmax_shifted(out, window_size - span)
+
+    return out
+
+
+class RollingMax:
+    """Streaming rolling max over the last window_size bars, O(1) amortised per bar
+
+    Keeps a deque of bars whose prices are decreasing, so the front is always the max.
+    A new price knocks out every smaller price before it, since they can never be
+    the max again. NaNs are skipped, as per pandas' rolling max.
+    """
+
+    def __init__(self, window_size=None):
+        """
+        Args:
+            window_size (int, optional): Defaults to None. Bars to look back over. None for all bars to date
+        """
+
+        self.window_size = window_size
+        self.bars = 0
+        self._candidates = deque()
+
+    def update(self, price):
+        """Adds the next bar
+
+        Args:
+            price (float): Price for the bar
+
+        Returns:
+            float: Max over the window ending at this bar, NaN if no prices in the window
+        """
+
+        bar = self.bars
+        self.bars += 1
+
+        if not math.isnan(price):
+            while self._candidates and self._candidates[-1][1] <= price:
+                self._candidates.pop()
+            self._candidates.append((bar, price))
+
+        # Drop bars that have fallen out of the window
+        if self.window_size is not None:
+            while self._candidates and self._candidates[0][0] <= bar - self.window_size:
+                self._candidates.popleft()
+
+        return self._candidates[0][1] if self._candidates else math.nan
+
+
+class DrawdownTracker:
+    """Streaming equivalent of calc_drawdown"""
+
+    def __init__(self, window_size=None):
+        """
+        Args:
+            window_size (int, optional): Defaults to None. How many units to look back. None for the all time high
+        """
+
+        self.prior_max = RollingMax(window_size)
+        self.drawdown = math.nan
+
+    def update(self, price):
+        """Adds the next bar
+
+        Args:
+            price (float): Price for the bar
+
+        Returns:
+            float: Drawdown as a percentage
+        """
+
+        prior_max = self.prior_max.update(price)
+
+        # Only a zero price can have a zero prior max, which numpy treats as 0/0
+        if prior_max == 0:
+            self.drawdown = math.nan
+            return self.drawdown
+
+        drawdown = (price / prior_max - 1.0) * 100
+        self.drawdown = 0.0 if drawdown == -100 else drawdown
+
+        return self.drawdown
+
+
+class LVRTracker:
+    """Streaming LVR of a margin loan with fixed holdings & loan balance, as per calc_lvr"""
+
+    def __init__(self, holdings, loan, base_lvr, buffer=0.0):
+        """
+        Args:
+            holdings (int): Number of shares held
+            loan (float): Amount borrowed
+            base_lvr (float): Max LVR allowed
+            buffer (float, optional): Defaults to 0.0. LVR buffer that triggers a margin call
+        """
+
+        self.holdings = holdings
+        self.loan = loan
+        self.base_lvr = base_lvr
+        self.buffer = buffer
+        self.value = math.nan
+        self.lvr = math.nan
+
+    @classmethod
+    def from_investment(cls, initial_investment, initial_lvr, start_price, base_lvr, buffer=0.0):
+        """Sets up the loan the same way calc_lvr does
+
+        Args:
+            initial_investment (int): Sum of personal contribution + loan
+            initial_lvr (float): Decimal percentage of loan value ratio (lvr)
+            start_price (float): Price the shares were bought at
+            base_lvr (float): Max LVR allowed
+            buffer (float, optional): Defaults to 0.0. LVR buffer that triggers a margin call
+
+        Returns:
+            LVRTracker: Tracker for the new loan
+        """
+
+        borrowed_investment = initial_investment / (1 - initial_lvr) * initial_lvr
+        total_investment = initial_investment + borrowed_investment
+        initial_holdings = math.floor(total_investment / start_price)
+
+        return cls(initial_holdings, borrowed_investment, base_lvr, buffer)
+
+    @property
+    def margin_call(self):
+        """Whether the current LVR is beyond the max LVR plus buffer"""
+
+        return self.lvr > self.base_lvr + self.buffer
+
+    def update(self, price):
+        """Adds the next bar
+
+        Args:
+            price (float): Close price for the bar
+
+        Returns:
+            float: LVR at this price
+        """
+
+        self.value = price * self.holdings
+        self.lvr = self.loan / self.value if self.value != 0 else math.inf
+
+        return self.lvr
+
+
+class MarginLoanMonitor:
+    """Tracks drawdown, LVR & margin call status of an open margin loan bar by bar
+
+    Warm it up with recent history via update_many, then feed it each new bar as it
+    arrives rather than reprocessing the full history.
+    """
+
+    def __init__(self, holdings, loan, base_lvr, buffer=0.0, drawdown_window=None):
+        """
+        Args:
+            holdings (int): Number of shares held
+            loan (float): Amount borrowed
+            base_lvr (float): Max LVR allowed
+            buffer (float, optional): Defaults to 0.0. LVR buffer that triggers a margin call
+            drawdown_window (int, optional): Defaults to None. Bars to measure drawdown over. None for the all time high
+        """
+
+        self.drawdown = DrawdownTracker(drawdown_window)
+        self.lvr = LVRTracker(holdings, loan, base_lvr, buffer)
+
+    def update(self, date, price):
+        """Adds the next bar
+
+        Args:
+            date (datetime): Date of the bar
+            price (float): Close price for the bar
+
+        Returns:
+            dict: Updated position
+        """
+
+        return {
+            "date": date,
+            "price": price,
+            "market_drawdown": self.drawdown.update(price),
+            "value": price * self.lvr.holdings,
+            "lvr": self.lvr.update(price),
+            "margin_call": self.lvr.margin_call,
+        }
+
+    def update_many(self, dates, prices):
+        """Adds a batch of bars
+
+        Args:
+            dates (array-like): Date of each bar
+            prices (array-like): Close price for each bar
+
+        Returns:
+            data.frame: Updated position after each bar
+        """
+
+        return pd.DataFrame([self.update(date, float(price)) for date, price in zip(dates, prices)])
+
+
+def entry_date_lvr_backtest(df, initial_investment, initial_lvrs, base_lvr, buffer=0.0, price_col="close", date_col="date"):
+    """Worst LVR reached for every possible entry date & initial LVR
+
+    With the loan & holdings fixed from entry, LVR peaks at the lowest price from then
+    on. A single backwards pass gives that lowest price for every entry date, so the
+    whole grid costs O(N x L) rather than running calc_lvr from every start date.
+
+    Args:
+        df (data.frame): EOD dataframe
+        initial_investment (int): Sum of personal contribution + loan, as per calc_lvr
+        initial_lvrs (array-like): Decimal initial LVRs to test
+        base_lvr (float): Max LVR allowed
+        buffer (float, optional): Defaults to 0.0. LVR buffer that triggers a margin call
+        price_col (str, optional): Defaults to "close". Column name for price data
+        date_col (str, optional): Defaults to "date". Column name for dates
+
+    Returns:
+        data.frame: Peak LVR, entry dates x initial LVRs. NaN where there's no valid price to buy at
+        data.frame: Whether a margin call occurred, entry dates x initial LVRs
+    """
+
+    prices = df[price_col].to_numpy(dtype=np.float64)
+    initial_lvrs = np.asarray(initial_lvrs, dtype=np.float64)
+
+    # Lowest price from each entry date onwards, ignoring missing prices
+    future_low = np.fmin.accumulate(prices[::-1])[::-1]
+
+    # Loan & holdings for each entry date & initial LVR, as per calc_lvr
+    borrowed_investment = initial_investment / (1 - initial_lvrs) * initial_lvrs
+    total_investment = initial_investment + borrowed_investment
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        buy_price = np.where(prices > 0, prices, np.nan)
+        holdings = np.floor(total_investment[np.newaxis, :] / buy_price[:, np.newaxis])
+        peak_lvr = borrowed_investment[np.newaxis, :] / (holdings * future_low[:, np.newaxis])
+
+    index = pd.DatetimeIndex(df[date_col], name=date_col)
+    columns = pd.Index(initial_lvrs, name="initial_lvr")
+
+    return (
+        pd.DataFrame(peak_lvr, index=index, columns=columns),
+        pd.DataFrame(peak_lvr > base_lvr + buffer, index=index, columns=columns),
+    )
+
+
+def _episode_bounds(drawdowns, mc_triggers, merge_within=0):
+    """Start & (exclusive) end bar of every run of bars beyond each trigger
+
+    Returns:
+        numpy.ndarray: Index of the trigger each episode belongs to
+        numpy.ndarray: First bar of each episode
+        numpy.ndarray: Bar after the last bar of each episode
+    """
+
+    drawdowns = np.asarray(drawdowns, dtype=np.float64)
+    mc_triggers = np.asarray(mc_triggers, dtype=np.float64)
+
+    # Triggers x bars, padded so every run has a rising & falling edge
+    in_call = np.zeros((len(mc_triggers), len(drawdowns) + 2), dtype=np.int8)
+    in_call[:, 1:-1] = -drawdowns[np.newaxis, :] > mc_triggers[:, np.newaxis]
+    edges = np.diff(in_call, axis=1)
+
+    # Edges come out row by row, so the nth rise & nth fall bound the same run
+    level, start = np.nonzero(edges == 1)
+    _, end = np.nonzero(edges == -1)
+
+    # Runs separated by a brief recovery are one episode
+    if merge_within > 0 and len(start) > 1:
+        new_episode = np.ones(len(start), dtype=bool)
+        new_episode[1:] = (level[1:] != level[:-1]) | (start[1:] - end[:-1] > merge_within)
+        last_run = np.append(new_episode[1:], True)
+        level, start, end = level[new_episode], start[new_episode], end[last_run]
+
+    return level, start, end
+
+
+def count_margin_call_episodes(drawdowns, mc_triggers, merge_within=0):
+    """Counts distinct margin call episodes at each trigger level
+
+    Unlike count_margin_calls, a crash spending many bars beyond a trigger counts
+    once, so counts are comparable across daily, weekly & monthly data.
+
+    Args:
+        drawdowns (array-like): Drawdowns as percentages in bar order, eg -12.5 for a 12.5% drop
+        mc_triggers (array-like): % drop required to trigger a margin call at each LVR
+        merge_within (int, optional): Defaults to 0. Episodes starting within this many bars
+            of the last one ending are counted as the same episode
+
+    Returns:
+        numpy.ndarray: Number of margin call episodes for each trigger
+    """
+
+    level, _, _ = _episode_bounds(drawdowns, mc_triggers, merge_within)
+    return np.bincount(level, minlength=len(mc_triggers))
+
+
+def margin_call_episodes(drawdowns, lvr_lookup, merge_within=0):
+    """Breaks a drawdown history into distinct margin call episodes for every LVR at once
+
+    An episode runs from the first bar beyond an LVR's trigger until the drawdown
+    eases back inside it. Episodes are found from the edges of a triggers x bars
+    mask, & troughs & recoveries with binary searches, so there's no looping over bars.
+
+    Args:
+        drawdowns (pandas.Series or array-like): Drawdowns as percentages, eg the market_drawdown
+            column from calc_drawdown. A DatetimeIndex is used to date the episodes
+        lvr_lookup (data.frame): Lookup table with LVRs & their corresponding margin call trigger
+        merge_within (int, optional): Defaults to 0. Episodes starting within this many bars
+            of the last one ending are treated as the same episode
+
+    Returns:
+        data.frame: One row per LVR & episode, with:
+            - start: First bar beyond the trigger
+            - trough: Bar with the deepest drawdown
+            - end: Last bar of the episode
+            - recovery: First bar after the trough back at the prior max, NaT/-1 if not yet recovered
+            - trough_drawdown: Deepest drawdown in the episode
+            - duration: Bars from start to end
+            - recovery_duration: Bars from start to recovery, NaN if not yet recovered
+    """
+
+    index = drawdowns.index if isinstance(drawdowns, pd.Series) else None
+    drawdowns = np.asarray(drawdowns, dtype=np.float64)
+    n = len(drawdowns)
+
+    level, start, end = _episode_bounds(drawdowns, lvr_lookup["mc_trigger"], merge_within)
+
+    # Deepest drawdown over each [start, end), read from pairs of reduceat boundaries.
+    # The extra element keeps an end of n in bounds
+    padded = np.append(drawdowns, np.nan)
+    bounds = np.column_stack((start, end)).ravel()
+    trough_drawdown = np.fmin.reduceat(padded, bounds)[::2] if len(bounds) > 0 else np.empty(0)
+
+    # First bar at or after each start holding that trough. Bars are ranked by drawdown,
+    # then bar, so each lookup is one binary search over (rank, bar) keys
+    values, ranks = np.unique(np.where(np.isnan(drawdowns), np.inf, drawdowns), return_inverse=True)
+    keys = np.sort(ranks.astype(np.int64) * n + np.arange(n))
+    trough_keys = np.searchsorted(values, trough_drawdown).astype(np.int64) * n + start
+    trough = keys[np.searchsorted(keys, trough_keys)] % n if len(keys) > 0 else np.empty(0, dtype=np.int64)
+
+    # Recovered once the drawdown is back to 0
+    highs = np.flatnonzero(drawdowns >= 0)
+    next_high = np.searchsorted(highs, trough)
+    recovered = next_high < len(highs)
+    recovery = np.where(recovered, highs[np.minimum(next_high, len(highs) - 1)] if len(highs) > 0 else -1, -1)
+
+    lvr_lookup = lvr_lookup.reset_index(drop=True)
+    df = pd.DataFrame(
+        {
+            "lvr": lvr_lookup["lvr"].to_numpy()[level],
+            "mc_trigger": lvr_lookup["mc_trigger"].to_numpy()[level],
+            "start": start,
+            "trough": trough,
+            "end": end - 1,
+            "recovery": recovery,
+            "trough_drawdown": trough_drawdown,
+            "duration": end - start,
+            "recovery_duration": np.where(recovered, recovery - start, np.nan),
+        }
+    )
+
+    # Date the episodes where the bars have dates
+    if isinstance(index, pd.DatetimeIndex):
+        for col in ["start", "trough", "end"]:
+            df[col] = index[df[col].to_numpy()]
+        df["recovery"] = index[recovery].where(recovered, pd.NaT)
+
+    return df
@@ -7,9 +7,31 @@ import numpy as np
 import pandas as pd
 from string import digits
 import math
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from yahoo_finance import get_yahoo_history
-from alpha_vantage.timeseries import TimeSeries
+from importlib import import_module
+from alpha_vantage_client import AlphaVantageClient
+from drawdown import count_margin_call_episodes
+from instrumentation import span, timed
+
+
+# Loaded on first use rather than at import, as the Yahoo downloader pulls in requests
+_DEFERRED = {"get_yahoo_history": "yahoo_finance"}
+
+
+def __getattr__(name):
+    if name not in _DEFERRED:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+    value = getattr(import_module(_DEFERRED[name]), name)
+    globals()[name] = value
+    return value
+
+
+def _deferred(name):
+    """A deferred attribute, loaded on first use unless it's already been set, eg patched in a test"""
+
+    return globals()[name] if name in globals() else __getattr__(name)
 
 
 def remove_numbers(string: str) -> str:
@@ -29,9 +51,12 @@ def remove_numbers(string: str) -> str:
     return string.translate(str.maketrans("", "", digits))
 
 
-def get_historical_data(key, time_slice, symbol):
+def get_historical_data(key, time_slice, symbol, client=None):
     """Wrapper function to source historical EOD stock data
 
+    Requests go through a client shared by everything using the same key, so they're
+    kept under the api quota & repeat requests are served from its cache.
+
     Args:
         key (str): alphavantage api key
         time_slice (str): Aggregate level to fetch. Options are:
@@ -39,21 +64,16 @@ def get_historical_data(key, time_slice, symbol):
                 - weekly
                 - monthly
         symbol (str): Symbol used, including the exchange
+        client (AlphaVantageClient, optional): Defaults to None. Client to use instead of the shared one
 
     Returns:
         DataFrame: EOD dataframe
     """
 
-    # Instantiate Session
-    ts = TimeSeries(key=key, output_format="pandas", indexing_type="integer")
-
     # Retrieve Data
-    if time_slice == "daily":
-        df, metadata = ts.get_daily(symbol, outputsize="full")
-    elif time_slice == "weekly":
-        df, metadata = ts.get_weekly(symbol)
-    elif time_slice == "monthly":
-        df, metadata = ts.get_monthly(symbol)
+    if client is None:
+        client = AlphaVantageClient.shared(key)
+    df = client.get(time_slice, symbol)
 
     # Replace 0's with NA's because they're almost certainly false
     df.replace(0, np.nan, inplace=True)
@@ -67,6 +87,7 @@ def get_historical_data(key, time_slice, symbol):
     return df
 
 
+@timed("helpers.calc_lvr")
 def calc_lvr(df, initial_investment, initial_lvr):
     """For a given investment, calculates LVR at each time unit based on price fluctuations
 
@@ -103,6 +124,7 @@ def calc_lvr(df, initial_investment, initial_lvr):
     return df_lvr
 
 
+@timed("helpers.calc_drawdown")
 def calc_drawdown(df, price_col, window_size):
     """Calculates drawdown
 
@@ -122,7 +144,7 @@ def calc_drawdown(df, price_col, window_size):
 
     # Calculate percentage change, aka drawdown
     df["market_drawdown"] = (df[price_col] / prior_max - 1.0) * 100
-    df["market_drawdown"].replace(-100, 0, inplace=True)
+    df["market_drawdown"] = df["market_drawdown"].replace(-100, 0)
 
     return df
 
@@ -184,46 +206,102 @@ def create_margin_call_range_table(max_lvr, buffer=0.1, step_size=0.01):
     return df
 
 
-def margin_call_samples(symbol, time_slice, drawdown_window, lvr_lookup):
-    """Helper function to wrap all steps
+def count_margin_calls(drawdowns, mc_triggers):
+    """Counts how many drawdowns would have triggered a margin call at each trigger level
+
+    Drawdowns are sorted once & each trigger located with a binary search, rather
+    than comparing every drawdown against every trigger.
+
+    Args:
+        drawdowns (array-like): Drawdowns as percentages, eg -12.5 for a 12.5% drop
+        mc_triggers (array-like): % drop required to trigger a margin call at each LVR
+
+    Returns:
+        numpy.ndarray: Number of margin calls for each trigger
+    """
+
+    drawdowns = np.asarray(drawdowns, dtype=np.float64)
+
+    # Only falls in price can trigger a call (NaN comparisons are False so they drop out)
+    falls = np.sort(np.abs(drawdowns[drawdowns < 1]))
+
+    # Drops strictly beyond each trigger
+    return len(falls) - np.searchsorted(
+        falls, np.asarray(mc_triggers, dtype=np.float64), side="right"
+    )
+
+
+def _margin_call_counter(count):
+    """Counting function for the count option of margin_call_samples & margin_call_matrix"""
+
+    if count == "bars":
+        return count_margin_calls
+    elif count == "episodes":
+        return count_margin_call_episodes
+    else:
+        raise ValueError("Please provide a valid count. The options are bars or episodes")
+
+
+def get_drawdown_history(symbol, time_slice, drawdown_window, cache=None, panel=None):
+    """Fetches price history since 2000 & calculates drawdown
 
     Args:
         symbol (str): Ticker code, noting to append exchange if required
         time_slice (str): daily, weekly or monthly
         drawdown_window (int): Number of periods to lookup. Note the units change based on the timeslice above
-        lvr_lookup (data.frame): Lookup table with LVRs & their corresponding margin call trigger
+        cache (PriceCache, optional): Defaults to None. Serve price history from this cache rather than downloading it all
+        panel (PricePanel, optional): Defaults to None. Read close prices from this panel instead of fetching them.
+            The panel is used as built, so time_slice is ignored
 
     Returns:
-        data.frame: Historical EOD data
-        data.frame: Lookup table with margin call frequency appended
-        float: Max safe LVR that would have historically avoided a margin call
+        data.frame: Historical EOD data with drawdown appended
     """
 
     # Get historical price data
-    df_eod = get_yahoo_history(
-        symbol=symbol,
-        start_date="2000-01-01",
-        end_date=datetime.now().strftime("%Y-%m-%d"),
-        frequency=time_slice,
-    )
+    with span("helpers.fetch_history"):
+        if panel is not None:
+            df_eod = panel.frame(symbol, price_col="Close", date_col="Date")
+        else:
+            fetch = _deferred("get_yahoo_history") if cache is None else cache.get_history
+            df_eod = fetch(
+                symbol=symbol,
+                start_date="2000-01-01",
+                end_date=datetime.now().strftime("%Y-%m-%d"),
+                frequency=time_slice,
+            )
 
     df_eod["symbol"] = symbol
 
     # Calculate Drawdown
-    df_eod = calc_drawdown(df_eod, price_col="Close", window_size=drawdown_window)
+    return calc_drawdown(df_eod, price_col="Close", window_size=drawdown_window)
+
+
+def margin_call_samples(symbol, time_slice, drawdown_window, lvr_lookup, cache=None, panel=None, count="bars"):
+    """Helper function to wrap all steps
+
+    Args:
+        symbol (str): Ticker code, noting to append exchange if required
+        time_slice (str): daily, weekly or monthly
+        drawdown_window (int): Number of periods to lookup. Note the units change based on the timeslice above
+        lvr_lookup (data.frame): Lookup table with LVRs & their corresponding margin call trigger
+        cache (PriceCache, optional): Defaults to None. Serve price history from this cache rather than downloading it all
+        panel (PricePanel, optional): Defaults to None. Read close prices from this panel instead of fetching them
+        count (str, optional): Defaults to "bars". What to count as a margin call. Options are:
+            - bars: Every bar beyond the trigger
+            - episodes: Each distinct run of bars beyond the trigger, see margin_call_episodes
+
+    Returns:
+        data.frame: Historical EOD data
+        data.frame: Lookup table with margin call frequency appended
+        float: Max safe LVR that would have historically avoided a margin call
+    """
+
+    counter = _margin_call_counter(count)
+    df_eod = get_drawdown_history(symbol, time_slice, drawdown_window, cache, panel)
 
     # Count margin calls for each LVR
-    mc_counts = list()
-    for row, col in lvr_lookup.iterrows():
-        # Identify drawdowns that would have caused a margin call
-        margin_calls = df_eod["market_drawdown"].apply(
-            lambda x: 1 if abs(x) > col["mc_trigger"] and x < 1 else 0
-        )
-
-        # Count instances
-        counts = margin_calls.value_counts()
-        mc_count = counts[1] if (len(counts) > 1) else 0
-        mc_counts.append(mc_count)
+    with span("helpers.count_margin_calls"):
+        mc_counts = counter(df_eod["market_drawdown"], lvr_lookup["mc_trigger"])
 
     lvr_lookup["{}_mc_count".format(symbol.replace(".", "_"))] = mc_counts
 
@@ -233,3 +311,65 @@ def margin_call_samples(symbol, time_slice, drawdown_window, lvr_lookup):
     )
 
     return df_eod, lvr_lookup, max_historical_safe_lvr
+
+
+def margin_call_matrix(symbols, time_slice, drawdown_window, lvr_lookup, max_workers=8, errors="raise",
+                       cache=None, panel=None, count="bars"):
+    """Counts margin calls at each LVR for many symbols at once
+
+    Symbols are fetched & processed concurrently. Unlike margin_call_samples the
+    lookup table isn't modified, so this is safe to call from multiple threads.
+
+    Args:
+        symbols (list): Ticker codes, noting to append exchange if required
+        time_slice (str): daily, weekly or monthly
+        drawdown_window (int): Number of periods to lookup. Note the units change based on the timeslice above
+        lvr_lookup (data.frame): Lookup table with LVRs & their corresponding margin call trigger
+        max_workers (int, optional): Defaults to 8. Number of symbols processed at once
+        errors (str, optional): Defaults to "raise". Either:
+            - raise: Any symbol failing to download stops the run
+            - ignore: Failing symbols are left out of the results
+        cache (PriceCache, optional): Defaults to None. Serve price history from this cache rather than downloading it all
+        panel (PricePanel, optional): Defaults to None. Read close prices from this panel instead of fetching them
+        count (str, optional): Defaults to "bars". Count every bar or each episode, as per margin_call_samples
+
+    Returns:
+        data.frame: Margin call counts, LVR x symbol
+        pandas.Series: Max safe LVR that would have historically avoided a margin call, per symbol
+    """
+
+    if errors not in ("raise", "ignore"):
+        raise ValueError("Please provide a valid errors option. The options are raise or ignore")
+    counter = _margin_call_counter(count)
+
+    mc_triggers = lvr_lookup["mc_trigger"].to_numpy()
+    max_lvr = lvr_lookup["lvr"].max()
+
+    def process_symbol(symbol):
+        try:
+            df_eod = get_drawdown_history(symbol, time_slice, drawdown_window, cache, panel)
+        except Exception:
+            if errors == "raise":
+                raise
+            return None
+
+        with span("helpers.count_margin_calls"):
+            mc_counts = counter(df_eod["market_drawdown"], mc_triggers)
+
+        return mc_counts, calc_max_safe_lvr(df_eod.market_drawdown.min(), max_lvr)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = dict(zip(symbols, pool.map(process_symbol, symbols)))
+
+    results = {symbol: x for symbol, x in results.items() if x is not None}
+
+    mc_counts = pd.DataFrame(
+        {symbol: x[0] for symbol, x in results.items()},
+        index=pd.Index(lvr_lookup["lvr"].to_numpy(), name="lvr"),
+        columns=list(results.keys()),
+    )
+    max_safe_lvr = pd.Series(
+        {symbol: x[1] for symbol, x in results.items()}, name="max_safe_lvr", dtype=np.float64
+    )
+
+    return mc_counts, max_safe_lvr
@@ -0,0 +1,273 @@
+"""
+Title: Instrumentation
+Description: Lightweight timing spans & counters for finding where a run spends its time
+
+Off by default, in which case span & count return straight away. Turn it on either:
+    - For a block of code with the instrument context manager
+    - For the whole process by setting FINSIGHTS_INSTRUMENT=1, with the report written
+      to $FINSIGHTS_INSTRUMENT_DIR (the working directory by default) on exit. Set
+      FINSIGHTS_PROFILE=1 to also dump a cProfile of the main thread
+
+Eg:
+    with instrument(output_dir="runs", profile=True) as run:
+        margin_call_matrix(symbols, "daily", 250, lvr_lookup)
+    print(run.to_dict()["spans"])
+"""
+
+import atexit
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from functools import wraps
+
+
+ENV_VAR = "FINSIGHTS_INSTRUMENT"
+DIR_ENV_VAR = "FINSIGHTS_INSTRUMENT_DIR"
+PROFILE_ENV_VAR = "FINSIGHTS_PROFILE"
+
+
+class Run:
+    """Span timings & counters collected while instrumentation is on
+
+    Spans with the same name are aggregated, so a span inside a loop reports its
+    number of calls & total, min & max time. Safe to record into from many threads.
+    """
+
+    def __init__(self, name=None, profile=False):
+        """
+        Args:
+            name (str, optional): Defaults to None, being the start time. Name used for exported files
+            profile (bool, optional): Defaults to False. Run cProfile over the calling thread too
+        """
+
+        self.started = datetime.now()
+        self.name = name or self.started.strftime("%Y%m%d_%H%M%S_%f")
+        self.spans = {}
+        self.counters = {}
+        self.profiler = cProfile.Profile() if profile else None
+        self._start = time.perf_counter()
+        self._end = None
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        """Adds a span's timing
+
+        Args:
+            name (str): Span name
+            seconds (float): Time spent in the span
+        """
+
+        with self._lock:
+            stats = self.spans.get(name)
+            if stats is None:
+                self.spans[name] = [1, seconds, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                stats[2] = min(stats[2], seconds)
+                stats[3] = max(stats[3], seconds)
+
+    def add(self, name, value=1):
+        """Increments a counter
+
+        Args:
+            name (str): Counter name
+            value (int, optional): Defaults to 1. Amount to add
+        """
+
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def stop(self):
+        """Stops the clock & profiler"""
+
+        if self.profiler is not None:
+            self.profiler.disable()
+        self._end = time.perf_counter()
+
+    @property
+    def wall_seconds(self):
+        return (self._end or time.perf_counter()) - self._start
+
+    def to_dict(self):
+        """Run summary, with spans ordered by total time
+
+        Returns:
+            dict: Run summary
+        """
+
+        with self._lock:
+            spans = {
+                name: {
+                    "calls": calls,
+                    "total_seconds": total,
+                    "mean_seconds": total / calls,
+                    "min_seconds": low,
+                    "max_seconds": high,
+                }
+                for name, (calls, total, low, high) in sorted(self.spans.items(), key=lambda x: -x[1][1])
+            }
+            counters = dict(sorted(self.counters.items()))
+
+        return {
+            "name": self.name,
+            "started": self.started.isoformat(),
+            "wall_seconds": self.wall_seconds,
+            "spans": spans,
+            "counters": counters,
+        }
+
+    def export(self, output_dir):
+        """Writes the run summary as json, plus the cProfile stats if profiled
+
+        Args:
+            output_dir (str): Directory to write to
+
+        Returns:
+            str: Path to the json summary
+        """
+
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, "finsights_{}.json".format(self.name))
+
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+        if self.profiler is not None:
+            self.profiler.dump_stats(os.path.join(output_dir, "finsights_{}.prof".format(self.name)))
+
+        return path
+
+
+class _Span:
+    __slots__ = ("run", "name", "start")
+
+    def __init__(self, run, name):
+        self.run = run
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.run.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+# Run being recorded into, None when instrumentation is off
+_active = None
+_NULL_SPAN = nullcontext()
+
+
+def active_run():
+    """Run currently being recorded, or None if instrumentation is off"""
+
+    return _active
+
+
+def span(name):
+    """Times a block of code
+
+    Args:
+        name (str): Span name, eg "yahoo.download"
+
+    Returns:
+        context manager: Records the block's time into the active run, if any
+    """
+
+    run = _active
+    if run is None:
+        return _NULL_SPAN
+
+    return _Span(run, name)
+
+
+def count(name, value=1):
+    """Increments a counter in the active run, if any
+
+    Args:
+        name (str): Counter name, eg "yahoo.bytes_fetched"
+        value (int, optional): Defaults to 1. Amount to add
+    """
+
+    run = _active
+    if run is not None:
+        run.add(name, value)
+
+
+def timed(name):
+    """Decorator timing every call to a function as a span
+
+    Args:
+        name (str): Span name
+    """
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return fn(*args, **kwargs)
+
+            with _Span(_active, name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def instrument(name=None, output_dir=None, profile=False):
+    """Turns instrumentation on for a block of code
+
+    Args:
+        name (str, optional): Defaults to None, being the start time. Name used for exported files
+        output_dir (str, optional): Defaults to None. Directory to export the run to on exit, if any
+        profile (bool, optional): Defaults to False. Run cProfile over the calling thread too
+
+    Yields:
+        Run: The run being recorded
+    """
+
+    global _active
+
+    run = Run(name, profile)
+    previous, _active = _active, run
+    if run.profiler is not None:
+        run.profiler.enable()
+
+    try:
+        yield run
+    finally:
+        run.stop()
+        _active = previous
+        if output_dir is not None:
+            run.export(output_dir)
+
+
+def _enable_from_environment():
+    """Records the whole process when FINSIGHTS_INSTRUMENT is set"""
+
+    global _active
+
+    if os.environ.get(ENV_VAR, "").lower() not in ("1", "true", "yes"):
+        return
+
+    profile = os.environ.get(PROFILE_ENV_VAR, "").lower() in ("1", "true", "yes")
+    _active = Run(profile=profile)
+    if profile:
+        _active.profiler.enable()
+
+    def export(run=_active):
+        run.stop()
+        run.export(os.environ.get(DIR_ENV_VAR, os.getcwd()))
+
+    atexit.register(export)
+
+
+_enable_from_environment()
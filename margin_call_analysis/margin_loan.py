@@ -0,0 +1,196 @@
+"""
+Title: Margin Loan Backtester
+Desc:  Simulates a margin loan's cash flows over a price history
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+
+CURE_ACTIONS = (None, "sell", "topup")
+
+
+def simulate_margin_loan(df, initial_investment, initial_lvr, base_lvr, buffer=0.0, interest_rate=0.0,
+                         capitalise_interest=True, dividends=None, drp=True, cure="sell",
+                         price_col="close", date_col="date"):
+    """Backtests a margin loan including interest, dividend reinvestment & margin call cures
+
+    Each bar, in order:
+        1. Interest accrues daily on the loan since the last bar
+        2. Dividends with an ex-date since the last bar are paid, & reinvested at the close if on a DRP
+        3. LVR is checked at the close. If it's beyond base_lvr + buffer, the margin call is
+           cured by selling shares or topping up cash until LVR is back at base_lvr. Bars
+           without a price are gaps, skipping the check & carrying the position forward
+
+    Holdings only change on dividends & cures, & between those the loan just compounds,
+    so the path is worked out a segment at a time with cumulative products rather than
+    bar by bar. That's a handful of numpy operations per dividend or margin call.
+
+    Args:
+        df (data.frame): EOD dataframe, as per calc_lvr
+        initial_investment (int): Sum of personal contribution + loan, as per calc_lvr
+        initial_lvr (float): Decimal percentage of loan value ratio (lvr)
+        base_lvr (float): Max LVR allowed
+        buffer (float, optional): Defaults to 0.0. LVR buffer that triggers a margin call
+        interest_rate (float, optional): Defaults to 0.0. Annual interest rate as a decimal
+        capitalise_interest (bool, optional): Defaults to True. Add interest to the loan,
+            otherwise it's paid out of pocket & the loan is left unchanged
+        dividends (pandas.Series, optional): Defaults to None. Dividend per share indexed by ex-date,
+            eg from get_yahoo_dividends
+        drp (bool, optional): Defaults to True. Reinvest dividends, otherwise they're taken as cash
+        cure (str, optional): Defaults to "sell". Action taken on a margin call. Options are:
+            - sell: Sell shares to pay down the loan
+            - topup: Pay cash off the loan
+            - None: Do nothing, just record the margin call
+        price_col (str, optional): Defaults to "close". Column name for price data
+        date_col (str, optional): Defaults to "date". Column name for dates
+
+    Returns:
+        data.frame: Loan position after each bar
+    """
+
+    if cure not in CURE_ACTIONS:
+        raise ValueError("Please provide a valid cure. The options are sell, topup or None")
+
+    prices = df[price_col].to_numpy(dtype=np.float64)
+    dates = pd.DatetimeIndex(df[date_col])
+    n = len(prices)
+    trigger = base_lvr + buffer
+
+    # Buy at the first valid close, as per calc_lvr
+    start = int(np.flatnonzero(prices > 0)[0])
+    borrowed_investment = initial_investment / (1 - initial_lvr) * initial_lvr
+    total_investment = initial_investment + borrowed_investment
+    holdings = math.floor(total_investment / prices[start])
+    loan = borrowed_investment
+    drp_balance = 0.0
+
+    # Interest growth of the loan, cumulative from the start of the history
+    days = np.zeros(n)
+    days[1:] = np.diff(dates.to_numpy()).astype("timedelta64[D]").astype(np.float64)
+    log_growth = np.cumsum(days * math.log1p(interest_rate / 365))
+
+    # Dividend per share paid on each bar, ex-dates falling between bars go to the next bar
+    dividend_per_share = np.zeros(n)
+    if dividends is not None and len(dividends) > 0:
+        bars = dates.searchsorted(pd.DatetimeIndex(dividends.index))
+        paid = (bars > start) & (bars < n)
+        np.add.at(dividend_per_share, bars[paid], dividends.to_numpy(dtype=np.float64)[paid])
+    dividend_bars = np.flatnonzero(dividend_per_share)
+
+    # Outputs
+    out_holdings = np.full(n, np.nan)
+    out_loan = np.full(n, np.nan)
+    out_lvr = np.full(n, np.nan)
+    out_interest = np.zeros(n)
+    out_dividends = np.zeros(n)
+    out_margin_call = np.zeros(n, dtype=bool)
+    out_top_up = np.zeros(n)
+    out_sold = np.zeros(n)
+
+    def fill_segment(first, last):
+        """Fills bars [first, last) with holdings unchanged since bar first - 1"""
+
+        growth = np.exp(log_growth[first:last] - log_growth[first - 1])
+        if capitalise_interest:
+            segment_loan = loan * growth
+            out_interest[first:last] = np.diff(np.concatenate(([loan], segment_loan)))
+        else:
+            segment_loan = np.full(last - first, loan)
+            out_interest[first:last] = loan * (np.exp(log_growth[first:last] - log_growth[first - 1:last - 1]) - 1)
+
+        # Bars without a price are gaps, with no LVR & so no margin call
+        segment_prices = prices[first:last]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            segment_lvr = np.where(segment_prices > 0, segment_loan / (holdings * segment_prices), np.nan)
+
+        out_holdings[first:last] = holdings
+        out_loan[first:last] = segment_loan
+        out_lvr[first:last] = segment_lvr
+        out_margin_call[first:last] = segment_lvr > trigger
+
+        return segment_lvr
+
+    out_holdings[start] = holdings
+    out_loan[start] = loan
+    out_lvr[start] = loan / (holdings * prices[start])
+    out_margin_call[start] = out_lvr[start] > trigger
+
+    bar = start
+    while bar < n - 1:
+        # Holdings are fixed until the next dividend
+        upcoming = np.searchsorted(dividend_bars, bar, side="right")
+        next_dividend = dividend_bars[upcoming] if upcoming < len(dividend_bars) else n
+
+        segment_lvr = fill_segment(bar + 1, next_dividend)
+
+        # A cured margin call changes the position, so pick up again from there.
+        # Once everything's been sold there's nothing left to cure with
+        calls = np.flatnonzero(segment_lvr > trigger) if cure is not None and holdings > 0 else []
+        if len(calls) > 0:
+            event = bar + 1 + calls[0]
+        elif next_dividend < n:
+            event = next_dividend
+        else:
+            break
+
+        # Roll the loan forward to the event bar
+        out_interest[event] = out_loan[event - 1] * (math.exp(log_growth[event] - log_growth[event - 1]) - 1)
+        if capitalise_interest:
+            loan = out_loan[event - 1] + out_interest[event]
+        price = prices[event]
+
+        # Dividends
+        if dividend_per_share[event] > 0:
+            dividend = holdings * dividend_per_share[event]
+            out_dividends[event] = dividend
+            if drp:
+                # Held over to the next dividend if there's no price to reinvest at
+                drp_balance += dividend
+                if price > 0:
+                    new_shares = math.floor(drp_balance / price)
+                    holdings += new_shares
+                    drp_balance -= new_shares * price
+
+        # Margin call & cure. Like the segments, a bar without a price is a gap & the
+        # position is carried through it unchecked
+        if price > 0:
+            lvr = loan / (holdings * price) if holdings > 0 else math.inf
+            out_margin_call[event] = lvr > trigger
+            if lvr > trigger and holdings > 0:
+                if cure == "sell":
+                    shares = min(holdings, math.ceil((loan - base_lvr * holdings * price) / (price * (1 - base_lvr))))
+                    holdings -= shares
+                    loan -= shares * price
+                    out_sold[event] = shares
+                elif cure == "topup":
+                    top_up = loan - base_lvr * holdings * price
+                    loan -= top_up
+                    out_top_up[event] = top_up
+                lvr = loan / (holdings * price) if holdings > 0 else math.inf
+        else:
+            lvr = np.nan
+
+        out_holdings[event] = holdings
+        out_loan[event] = loan
+        out_lvr[event] = lvr
+
+        bar = event
+
+    return pd.DataFrame(
+        {
+            "date": dates,
+            "price": prices,
+            "holdings": out_holdings,
+            "loan": out_loan,
+            "value": out_holdings * prices,
+            "lvr": out_lvr,
+            "interest": out_interest,
+            "dividends": out_dividends,
+            "margin_call": out_margin_call,
+            "top_up": out_top_up,
+            "shares_sold": out_sold,
+        }
+    )
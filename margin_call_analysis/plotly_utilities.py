@@ -3,14 +3,198 @@ Title:  Plotly Utilities
 Desc:   Helper functions for generating plotly graphics
 Author: Yassin Elathir
 Date:   2017-12-30
+
+plotly is imported by the functions building figures, so the binning & downsampling
+helpers can be used without paying for it.
 """
 
+import numpy as np
 import pandas as pd
-import plotly.graph_objs as go
+
+
+# Total points in a figure beyond which webgl='auto' renders with WebGL
+WEBGL_THRESHOLD = 20000
+
+
+def split_by_key(df, key_col, keys, columns):
+    """Splits a long dataframe into each key's values in a single pass
+
+    The key column is factorised & stably sorted once, after which each key's rows are
+    a contiguous slice. Rows keep their original order within a key.
+
+    Args:
+        df (data.frame): Long format data
+        key_col (str): The column name containing the lookup keys
+        keys (list or str): The keys to return, or 'all' for every key in order of appearance
+        columns (list): Columns to return for each key
+
+    Returns:
+        list: (key, dict of column name to numpy array) for each key. Missing keys have no rows
+    """
+
+    codes, uniques = pd.factorize(df[key_col])
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+
+    if isinstance(keys, str) and keys == 'all':
+        keys = list(uniques)
+    elif not isinstance(keys, list):
+        keys = [keys]
+
+    sorted_cols = {col: df[col].to_numpy()[order] for col in columns}
+    positions = {key: i for i, key in enumerate(uniques)}
+
+    groups = []
+    for key in keys:
+        i = positions.get(key)
+        rows = slice(0, 0) if i is None else slice(bounds[i], bounds[i + 1])
+        groups.append((key, {col: vals[rows] for col, vals in sorted_cols.items()}))
+
+    return groups
+
+
+def _numeric_axis(x):
+    """x values as floats for geometry, dates as nanoseconds & anything else by position"""
+
+    x = np.asarray(x)
+    if x.dtype.kind in 'Mm':
+        return x.astype('datetime64[ns]' if x.dtype.kind == 'M' else 'timedelta64[ns]').astype(np.int64).astype(np.float64)
+    elif x.dtype.kind in 'iuf':
+        return x.astype(np.float64)
+
+    return np.arange(len(x), dtype=np.float64)
+
+
+def lttb(x, y, max_points):
+    """Largest Triangle Three Buckets downsampling
+
+    Splits the series into max_points - 2 buckets between the first & last points, &
+    keeps the point in each bucket forming the largest triangle with the point kept
+    before it & the average of the next bucket. Unlike taking every nth point this
+    keeps the shape of spikes & troughs. The series' highest & lowest points are
+    always kept, so the worst drawdown is never smoothed away.
+
+    Args:
+        x (array-like): x values, numbers or dates
+        y (array-like): y values
+        max_points (int): Target number of points to keep
+
+    Returns:
+        numpy.ndarray: Sorted positions of the points to keep. Missing y values are dropped when downsampling
+    """
+
+    y = np.asarray(y, dtype=np.float64)
+    if len(y) <= max_points or max_points < 3:
+        return np.arange(len(y))
+
+    x = _numeric_axis(x)
+    valid = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    x, y = x[valid], y[valid]
+    n = len(y)
+
+    if n <= max_points:
+        return valid
+
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    keep = np.empty(max_points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+
+    # Loops over buckets rather than points, each bucket handled with numpy
+    a = 0
+    for i in range(max_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = (hi, edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        cx, cy = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+
+    return valid[np.union1d(keep, [np.argmin(y), np.argmax(y)])]
+
+
+def ohlc_buckets(n, max_points):
+    """First row of each bucket when aggregating n bars down to at most max_points
+
+    Args:
+        n (int): Number of bars
+        max_points (int): Maximum number of buckets
+
+    Returns:
+        numpy.ndarray: Start of each bucket, for use with numpy's reduceat
+    """
+
+    return np.arange(0, n, max(-(-n // max_points), 1))
+
+
+HISTNORMS = ('', 'percent', 'probability', 'density', 'probability density')
+
+
+def binned_counts(values, bins, groups=None, n_groups=1):
+    """Histogram counts for many series in one pass
+
+    Every series shares the same bin edges, so their bars line up. Each value's bin is
+    found with a binary search & counted against its series with a single bincount.
+
+    Args:
+        values (array-like): Values to bin
+        bins (int, str or array-like): Number of bins, a numpy binning method eg 'auto', or the bin edges
+        groups (array-like, optional): Defaults to None. Series each value belongs to, from 0 to n_groups - 1.
+            Negative values are left out
+        n_groups (int, optional): Defaults to 1. Number of series
+
+    Returns:
+        numpy.ndarray: Counts, series x bins
+        numpy.ndarray: Bin edges
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    groups = np.zeros(len(values), dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+
+    valid = np.isfinite(values) & (groups >= 0)
+    edges = np.histogram_bin_edges(values[valid], bins)
+    n_bins = len(edges) - 1
+
+    # Bins include their left edge, except the last which includes both, as per numpy
+    bin_idx = np.searchsorted(edges, values, side='right') - 1
+    bin_idx[values == edges[-1]] = n_bins - 1
+    valid &= (bin_idx >= 0) & (bin_idx < n_bins)
+
+    counts = np.bincount(groups[valid] * n_bins + bin_idx[valid], minlength=n_groups * n_bins)
+
+    return counts.reshape(n_groups, n_bins), edges
+
+
+def normalise_counts(counts, edges, histnorm=''):
+    """Applies plotly's histnorm normalisation to binned counts
+
+    Args:
+        counts (numpy.ndarray): Counts, series x bins
+        edges (numpy.ndarray): Bin edges
+        histnorm (str, optional): Defaults to ''. One of HISTNORMS, '' leaves the counts as is
+
+    Returns:
+        numpy.ndarray: Normalised bar heights, series x bins
+    """
+
+    if histnorm not in HISTNORMS:
+        raise ValueError("Please provide a valid histnorm. The options are percent, probability, density or probability density")
+
+    heights = counts.astype(np.float64)
+    total = heights.sum(axis=1, keepdims=True)
+
+    if histnorm in ('percent', 'probability', 'probability density'):
+        heights = np.divide(heights, total, out=np.zeros_like(heights), where=total > 0)
+    if histnorm == 'percent':
+        heights *= 100
+    if histnorm in ('density', 'probability density'):
+        heights /= np.diff(edges)
+
+    return heights
 
 
 # Basic Candlesticks
-def candles(df, open, high, low, close, time, title, base_currency):
+def candles(df, open, high, low, close, time, title, base_currency, max_points=None):
     """
     Generates Candlesticks
 
@@ -21,16 +205,31 @@ def candles(df, open, high, low, close, time, title, base_currency):
     :param low:
     :param close:
     :param time:
+    :param max_points: Defaults to None. Aggregate bars into at most this many candles, each
+                       opening at its first bar, closing at its last & spanning their full range
 
     :return:
     """
 
-    data = [go.Candlestick(x=df[time],
-                           open=df[open],
-                           high=df[high],
-                           low=df[low],
-                           close=df[close]
-                           )]
+    import plotly.graph_objs as go
+
+    if max_points is not None and len(df) > max_points:
+        starts = ohlc_buckets(len(df), max_points)
+        ends = np.append(starts[1:], len(df)) - 1
+
+        data = [go.Candlestick(x=df[time].to_numpy()[starts],
+                               open=df[open].to_numpy()[starts],
+                               high=np.fmax.reduceat(df[high].to_numpy(dtype=np.float64), starts),
+                               low=np.fmin.reduceat(df[low].to_numpy(dtype=np.float64), starts),
+                               close=df[close].to_numpy()[ends]
+                               )]
+    else:
+        data = [go.Candlestick(x=df[time],
+                               open=df[open],
+                               high=df[high],
+                               low=df[low],
+                               close=df[close]
+                               )]
 
     layout = go.Layout(
         title=title,
@@ -43,7 +242,8 @@ def candles(df, open, high, low, close, time, title, base_currency):
     return fig
 
 
-def timeseries(df, x, y, title='', xlabel='', ylabel='', lines=None, shape='wide', key_col='', keys=''):
+def timeseries(df, x, y, title='', xlabel='', ylabel='', lines=None, shape='wide', key_col='', keys='',
+               max_points=None, webgl=False):
     """Simple Timeseries Plot
     
     Args:
@@ -61,42 +261,57 @@ def timeseries(df, x, y, title='', xlabel='', ylabel='', lines=None, shape='wide
         key_col (str, optional): Defaults to ''.
             - Only required if shape = "long"
             - The column name containing the lookup keys
-        keys (str, optional): Defaults to ''.
+        keys (str or list, optional): Defaults to ''.
             - The keys to charts
+            - 'all' charts every key in order of appearance
+        max_points (int, optional): Defaults to None. Downsample each series to about this many points with lttb
+        webgl (bool or str, optional): Defaults to False.
+            - True: Render with WebGL (Scattergl)
+            - 'auto': Render with WebGL once the figure has more than WEBGL_THRESHOLD points
     
     Returns:
         Plotly scatter plot figure
     """
 
+    import plotly.graph_objs as go
+
     # Charting requires list input but string accepted to make the users life a tad easier
     if not isinstance(y, list):
         y = [y]
-    if not isinstance(keys, list):
-        keys = [keys]
 
     if lines is None:
         lines = []
 
     # Generate data for chart based on structure of the data
     if shape=='wide':
-        data = [go.Scatter(
-            x=df[x],
-            y=df[vals],
-            name=vals
-        ) for vals in y]
+        series = [(df[x], df[vals], vals) for vals in y]
 
     elif shape=='long':
         if key_col == '':
             raise ValueError("Please provide the column name containing your series names")
-        
-        data = [go.Scatter(
-            x = df[df[key_col]==key][x],
-            y = df[df[key_col]==key][y[0]],
-            name = key
-        ) for key in keys]
+
+        series = [(group[x], group[y[0]], key) for key, group in split_by_key(df, key_col, keys, [x, y[0]])]
     else:
         raise ValueError("Please provide a valid shape")
 
+    # Large figures get decimated & drawn with WebGL so they stay responsive
+    if max_points is not None:
+        decimated = []
+        for sx, sy, name in series:
+            keep = lttb(sx, sy, max_points)
+            decimated.append((np.asarray(sx)[keep], np.asarray(sy)[keep], name))
+        series = decimated
+
+    if webgl == 'auto':
+        webgl = sum(len(sy) for _, sy, _ in series) > WEBGL_THRESHOLD
+    trace = go.Scattergl if webgl else go.Scatter
+
+    data = [trace(
+        x=sx,
+        y=sy,
+        name=name
+    ) for sx, sy, name in series]
+
     layout = go.Layout(
         title=title,
         xaxis=dict(title=xlabel),
@@ -141,7 +356,7 @@ def create_line(action, timestamp, y_min, y_max):
 
 
 
-def histogram(df, values, title='', xlabel='', ylabel='', shape='wide', key_col='', keys='', type=''):
+def histogram(df, values, title='', xlabel='', ylabel='', shape='wide', key_col='', keys='', type='', bins=None):
     """Plotly Historgram Helper Function
     
     Args:
@@ -158,24 +373,33 @@ def histogram(df, values, title='', xlabel='', ylabel='', shape='wide', key_col=
         key_col (str, optional): Defaults to ''.
             - Only required if shape = "long"
             - The column name containing the lookup keys
-        keys (str, optional): Defaults to ''.
+        keys (str or list, optional): Defaults to ''.
             - The keys to charts
+            - 'all' charts every key in order of appearance
         type (str, optional): Defaults to ''.
             - Normalisation used for histogram. Options are:
                 "percent" | "probability" | "density" | "probability density" 
+        bins (int, str or list, optional): Defaults to None.
+            - None: Raw values are sent to plotly & binned in the browser
+            - Otherwise values are binned up front & drawn as bars, so the figure's size
+              depends on the number of bins rather than rows. Either the number of bins,
+              a numpy binning method eg 'auto', or the bin edges
 
     Returns:
         Plotly histogram figure
     """
 
+    import plotly.graph_objs as go
+
     # Charting requires list input but string accepted to make the users life a tad easier
     if not isinstance(values, list):
         values = [values]
-    if not isinstance(keys, list):
-        keys = [keys]
 
     # Generate data for chart based on structure of the data
-    if shape=='wide':
+    if bins is not None:
+        data = _prebinned_histogram(df, values, shape, key_col, keys, type, bins)
+
+    elif shape=='wide':
         data = [go.Histogram(
             x = df[vals],
             histnorm = type,
@@ -187,10 +411,10 @@ def histogram(df, values, title='', xlabel='', ylabel='', shape='wide', key_col=
             raise ValueError("Please provide the column name containing your series names")
         
         data = [go.Histogram(
-            x = df[df[key_col]==key][values[0]],
+            x = group[values[0]],
             histnorm = type,
             name = key
-        ) for key in keys]
+        ) for key, group in split_by_key(df, key_col, keys, [values[0]])]
 
     else:
         raise ValueError("Please provide a valid shape")
@@ -201,6 +425,53 @@ def histogram(df, values, title='', xlabel='', ylabel='', shape='wide', key_col=
             yaxis=dict(title=ylabel),
             xaxis=dict(title=xlabel)
             )
+    if bins is not None:
+        layout.bargap = 0
 
     fig = go.Figure(data=data, layout=layout)
-    return fig
\ No newline at end of file
+    return fig
+
+
+def _prebinned_histogram(df, values, shape, key_col, keys, histnorm, bins):
+    """Bar traces of histogram counts binned with numpy, for histogram's bins option"""
+
+    import plotly.graph_objs as go
+
+    if shape=='wide':
+        names = values
+        groups = np.repeat(np.arange(len(values)), len(df))
+        x = df[values].to_numpy(dtype=np.float64).ravel(order='F')
+
+    elif shape=='long':
+        if key_col == '':
+            raise ValueError("Please provide the column name containing your series names")
+
+        # Map each row's key to its series, with rows for other keys left out
+        codes, uniques = pd.factorize(df[key_col])
+        if isinstance(keys, str) and keys == 'all':
+            names = list(uniques)
+        else:
+            names = keys if isinstance(keys, list) else [keys]
+
+        positions = {key: i for i, key in enumerate(names)}
+        series = np.array([positions.get(key, -1) for key in uniques] + [-1], dtype=np.int64)
+        groups = series[codes]
+        x = df[values[0]].to_numpy(dtype=np.float64)
+
+    else:
+        raise ValueError("Please provide a valid shape")
+
+    counts, edges = binned_counts(x, bins, groups, len(names))
+    heights = normalise_counts(counts, edges, histnorm)
+    centres = (edges[:-1] + edges[1:]) / 2
+
+    # Plotly sizes evenly spaced bars itself, which keeps multiple series grouped like go.Histogram
+    widths = np.diff(edges)
+    widths = None if np.allclose(widths, widths[0]) else widths
+
+    return [go.Bar(
+        x = centres,
+        y = heights[i],
+        width = widths,
+        name = name
+    ) for i, name in enumerate(names)]
@@ -0,0 +1,168 @@
+"""
+Title: Price History Cache
+Description: Keeps downloaded EOD data on disk so only new dates need fetching
+"""
+
+import os
+import re
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import count, span
+from yahoo_finance import get_yahoo_history, yahoo_frequency
+
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "FINSIGHTS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "finsights")
+)
+
+
+class PriceCache:
+    """On-disk cache of EOD price history, one file per (symbol, frequency)
+
+    Each file is a numpy .npz holding one array per column plus the date range
+    that has been requested so far. Requests are served from disk, with only the
+    dates outside that range downloaded & appended.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, fetch=get_yahoo_history):
+        """
+        Args:
+            cache_dir (str, optional): Directory to store the cache in.
+                Defaults to $FINSIGHTS_CACHE_DIR, or ~/.cache/finsights
+            fetch (function, optional): Defaults to get_yahoo_history.
+                Downloader with the same signature as get_yahoo_history
+        """
+
+        self.cache_dir = cache_dir
+        self.fetch = fetch
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, symbol, frequency):
+        """File holding the cache for a symbol
+
+        Args:
+            symbol (str): Ticker symbol+including exchange. Eg "AFI.AX"
+            frequency (str): daily, weekly or monthly
+
+        Returns:
+            str: Path to the cache file
+        """
+
+        safe_symbol = re.sub(r"[^A-Za-z0-9.^_-]", "_", symbol)
+        return os.path.join(self.cache_dir, "{}_{}.npz".format(safe_symbol, frequency))
+
+    def load(self, symbol, frequency):
+        """Reads a symbol's cached history
+
+        Args:
+            symbol (str): Ticker symbol+including exchange. Eg "AFI.AX"
+            frequency (str): daily, weekly or monthly
+
+        Returns:
+            DataFrame, str, str: Cached EOD data along with the first & last dates covered.
+                All None if nothing is cached
+        """
+
+        path = self.path(symbol, frequency)
+        if not os.path.exists(path):
+            return None, None, None
+
+        with np.load(path, allow_pickle=False) as cached:
+            columns = cached["columns"].tolist()
+            df = pd.DataFrame(
+                {col: cached["col_{}".format(i)] for i, col in enumerate(columns)},
+                index=pd.DatetimeIndex(cached["index"], name="Date"),
+                columns=columns,
+            )
+            covered_start, covered_end = cached["covered"].tolist()
+
+        return df, covered_start, covered_end
+
+    def save(self, symbol, frequency, df, covered_start, covered_end):
+        """Writes a symbol's history, replacing anything cached
+
+        Args:
+            symbol (str): Ticker symbol+including exchange. Eg "AFI.AX"
+            frequency (str): daily, weekly or monthly
+            df (DataFrame): EOD data with a DatetimeIndex & numeric or date columns
+            covered_start (str): First date requested, in format of YYYY-MM-DD
+            covered_end (str): Last date requested, in format of YYYY-MM-DD
+        """
+
+        arrays = {
+            "index": df.index.to_numpy(),
+            "columns": np.array(df.columns.tolist(), dtype=str),
+            "covered": np.array([covered_start, covered_end], dtype=str),
+        }
+        for i, col in enumerate(df.columns):
+            arrays["col_{}".format(i)] = df[col].to_numpy()
+
+        # Write to a temp file & swap it in so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, self.path(symbol, frequency))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def get_history(self, symbol, start_date, end_date, frequency):
+        """Cached drop-in for get_yahoo_history
+
+        Args:
+            symbol (str): Ticker symbol+including exchange. Eg "AFI.AX"
+            start_date (str): Date in format of YYYY-MM-DD
+            end_date (str): Date in format of YYYY-MM-DD
+            frequency (str): Aggregate level. Options are:
+                - daily
+                - weekly
+                - monthly
+
+        Returns:
+            pandas.core.frame.DataFrame: EOD data
+        """
+
+        with span("price_cache.load"):
+            df, covered_start, covered_end = self.load(symbol, frequency)
+
+        if df is None:
+            count("price_cache.misses")
+            df = self.fetch(symbol=symbol, start_date=start_date, end_date=end_date, frequency=frequency)
+            covered_start, covered_end = start_date, end_date
+            self.save(symbol, frequency, df, covered_start, covered_end)
+
+        else:
+            before, after = None, None
+
+            # Dates before anything fetched so far. Runs up to the first cached date so the last
+            # bar before it lands on this download's calendar, eg a weekly bar dated mid week
+            if start_date < covered_start:
+                before = self.fetch(
+                    symbol=symbol, start_date=start_date, end_date=covered_start, frequency=frequency)
+                covered_start = start_date
+
+            # Top up from the last date fetched, refreshing it in case that bar was incomplete
+            if end_date > covered_end:
+                after = self.fetch(
+                    symbol=symbol, start_date=covered_end, end_date=end_date, frequency=frequency)
+                covered_end = end_date
+
+            count("price_cache.hits" if before is None and after is None else "price_cache.partial_hits")
+            if before is not None or after is not None:
+                # Where downloads overlap, cached rows win over earlier ones & the top up wins over both
+                df = pd.concat([x for x in (before, df, after) if x is not None and len(x) > 0])
+                df = df[~df.index.duplicated(keep="last")].sort_index()
+
+                # Each download is put on its own calendar, so the dates between segments
+                # (eg a weekend either side of a join) need forward filling as per a single download
+                _, freq = yahoo_frequency(frequency)
+                calendar = pd.date_range(df.index[0], df.index[-1], freq=freq, name="Date")
+                df = df.reindex(calendar, method="ffill")
+
+                self.save(symbol, frequency, df, covered_start, covered_end)
+
+        return df[(df.index >= start_date) & (df.index <= end_date)]
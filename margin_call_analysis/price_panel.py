@@ -0,0 +1,156 @@
+"""
+Title: Price Panel Store
+Description: Memory mapped dates x symbols close price panel shared between processes
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class PricePanel:
+    """Close prices for many symbols on a shared date axis, memory mapped from disk
+
+    Stored as a directory of .npy files:
+        - dates.npy: The shared date axis
+        - symbols.npy: Symbol for each column
+        - close.npy: Dates x symbols close prices as float64. Column major, so each
+          symbol's history is contiguous & can be viewed without copying
+
+    Any number of processes can open the same panel & read it zero-copy. Pickling a
+    panel only sends its path, so it can be handed to worker processes cheaply.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Directory the panel was built in
+        """
+
+        self.path = path
+        self.dates = pd.DatetimeIndex(np.load(os.path.join(path, "dates.npy")), name="Date")
+        self.symbols = np.load(os.path.join(path, "symbols.npy")).tolist()
+        self.close = np.load(os.path.join(path, "close.npy"), mmap_mode="r")
+        self._columns = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+    @classmethod
+    def build(cls, path, frames, ffill=True):
+        """Builds a panel from EOD data
+
+        Args:
+            path (str): Directory to build the panel in
+            frames (dict): EOD dataframe for each symbol, as returned by either:
+                - get_yahoo_history: "Close" column with a DatetimeIndex
+                - get_historical_data: "close" & "date" columns
+            ffill (bool, optional): Defaults to True. Forward fill dates missing from a symbol's history,
+                eg public holidays on one exchange but not another. Dates before a symbol
+                has any history are left as NaN, as are symbols with no prices at all
+
+        Returns:
+            PricePanel: The new panel, opened for reading
+        """
+
+        prices = {symbol: _close_series(df) for symbol, df in frames.items()}
+        symbols = list(prices.keys())
+
+        # Shared date axis covering every symbol
+        dates = pd.DatetimeIndex([])
+        for series in prices.values():
+            dates = dates.union(series.index)
+
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "dates.npy"), dates.to_numpy(dtype="datetime64[ns]"))
+        np.save(os.path.join(path, "symbols.npy"), np.array(symbols, dtype=str))
+
+        # Written a symbol at a time so only one history is held in memory
+        close = np.lib.format.open_memmap(
+            os.path.join(path, "close.npy"), mode="w+", dtype=np.float64,
+            shape=(len(dates), len(symbols)), fortran_order=True,
+        )
+        for i, symbol in enumerate(symbols):
+            series = prices[symbol].reindex(dates)
+            last_valid = series.last_valid_index()
+            # Symbols without any prices are kept as an all NaN column
+            if ffill and last_valid is not None:
+                series = series.ffill()
+                series[series.index > last_valid] = np.nan
+            close[:, i] = series.to_numpy()
+
+        close.flush()
+        del close
+
+        return cls(path)
+
+    def series(self, symbol):
+        """Close prices for a symbol, viewed straight from the memory map
+
+        Args:
+            symbol (str): Ticker symbol
+
+        Returns:
+            numpy.ndarray: Read only close prices, aligned to PricePanel.dates
+        """
+
+        if symbol not in self._columns:
+            raise ValueError("{} isn't in this panel".format(symbol))
+
+        return self.close[:, self._columns[symbol]]
+
+    def frame(self, symbol, price_col="close", date_col="date", dropna=True):
+        """EOD dataframe for a symbol, ready for calc_drawdown, calc_lvr, etc
+
+        Args:
+            symbol (str): Ticker symbol
+            price_col (str, optional): Defaults to "close". Name of the price column
+            date_col (str, optional): Defaults to "date". Name of the date column
+            dropna (bool, optional): Defaults to True. Drop dates before the symbol has any history
+
+        Returns:
+            data.frame: Date & price columns with a DatetimeIndex
+        """
+
+        prices = self.series(symbol)
+        dates = self.dates
+
+        if dropna:
+            valid = np.flatnonzero(~np.isnan(prices))
+            first = valid[0] if len(valid) > 0 else len(prices)
+            prices = prices[first:]
+            dates = dates[first:]
+
+        return pd.DataFrame({date_col: dates, price_col: prices}, index=dates, copy=False)
+
+    def to_frame(self):
+        """The whole panel as a dates x symbols dataframe
+
+        Returns:
+            data.frame: Close prices backed by the memory map
+        """
+
+        return pd.DataFrame(self.close, index=self.dates, columns=self.symbols, copy=False)
+
+    def __contains__(self, symbol):
+        return symbol in self._columns
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __reduce__(self):
+        return (self.__class__, (self.path,))
+
+
+def _close_series(df):
+    """Close prices from either Yahoo or Alpha Vantage EOD data, indexed by date"""
+
+    if "Close" in df.columns:
+        series = df["Close"]
+        if not isinstance(df.index, pd.DatetimeIndex):
+            series = series.set_axis(pd.DatetimeIndex(df["Date"]))
+    elif "close" in df.columns:
+        series = df["close"].set_axis(pd.DatetimeIndex(df["date"]))
+    else:
+        raise ValueError("Please provide EOD data with either a Close or close column")
+
+    series = series.astype(np.float64)
+    return series[~series.index.duplicated(keep="last")].sort_index()
@@ -5,10 +5,17 @@ Description: Downloads EOD data from Yahoo Finance
 
 import requests
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from time import mktime
-from io import StringIO
+from io import BytesIO
+import numpy as np
 import pandas as pd
+from requests.adapters import HTTPAdapter
+
+from instrumentation import count, span
 
 
 def time_str_to_unix(date):
@@ -25,78 +32,333 @@ def time_str_to_unix(date):
     return int(mktime(datum.timetuple()))
 
 
-def get_yahoo_history(symbol, start_date, end_date, frequency):
-    """Scrapes data from the yahoo finance download data endpoint
+def yahoo_frequency(frequency):
+    """Maps a frequency to what Yahoo & pandas expect
 
     Args:
-        symbol (str): Ticker symbol+including exchange. Eg "AFI.AX"
-        start_date (str): Date in format of YYYY-MM-DD
-        end_date (str): Date in format of YYYY-MM-DD
-        frequency (str): Aggregate level. Options are:
-            - daily
-            - weekly
-            - monthly
+        frequency (str): Aggregate level. Options are daily, weekly or monthly
 
     Returns:
-        pandas.core.frame.DataFrame: EOD data
+        str, str: Yahoo interval & pandas frequency
     """
 
-    # Get session info
-    session_url = "https://au.finance.yahoo.com/quote/{}/history".format(symbol)
-    session = requests.Session()
-    yahoo_session = session.get(session_url)
-
-    # Crumb required for each request
-    yahoo_crumb = re.findall('"CrumbStore":{"crumb":"(.+?)"}', yahoo_session.text)
-    if len(yahoo_crumb) == 0:
-        raise ValueError("No crumb found. Probably couldn't find your symbol.")
-    else:
-        yahoo_crumb = yahoo_crumb[0]
-
-    # Map frequency to what Yahoo expect
     if frequency == "daily":
-        frequency = "1d"
-        freq = "D"
+        return "1d", "D"
     elif frequency == "weekly":
-        frequency = "1wk"
-        freq = "W"
+        return "1wk", "W"
     elif frequency == "monthly":
-        frequency = "1mo"
-        freq = "M"
+        return "1mo", "M"
     else:
         raise ValueError(
             "Please provide a valid frequncy. The options are daily, weekly or monthly"
         )
 
-    # "Download" data from Yahoo
-    final_url = "https://query1.finance.yahoo.com/v7/finance/download/{}?period1={}&period2={}&interval={}&events=history&crumb={}".format(
-        symbol,
-        time_str_to_unix(start_date),
-        time_str_to_unix(end_date),
-        frequency,
-        yahoo_crumb,
-    )
 
-    response = session.get(final_url)
+# Yahoo download columns holding prices, the rest are left to pandas
+PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Adj Close"]
+
+
+def parse_yahoo_csv(content, freq, price_dtype=np.float64):
+    """Parses a Yahoo EOD csv download onto a regular, forward filled calendar
+
+    Works straight off the raw bytes with fixed dtypes & date format so nothing is
+    inferred, & fills the calendar with a single gather per column rather than
+    building an intermediate frame.
+
+    Args:
+        content (bytes): Raw csv response body
+        freq (str): Pandas frequency of the calendar, eg "D"
+        price_dtype (numpy.dtype, optional): Defaults to numpy.float64. Use numpy.float32 to halve memory
+
+    Returns:
+        pandas.core.frame.DataFrame: EOD data
+    """
+
+    dtypes = {col: price_dtype for col in PRICE_COLUMNS}
+    dtypes["Volume"] = np.float64
+    with span("yahoo.read_csv"):
+        df = pd.read_csv(BytesIO(content), dtype=dtypes, na_values=["null"])
+    count("yahoo.rows_parsed", len(df))
+
+    dates = pd.DatetimeIndex(pd.to_datetime(df["Date"].to_numpy(), format="%Y-%m-%d"), name="Date")
+    if len(dates) == 0:
+        return df.set_index(dates, drop=False)
+
+    # Each calendar date takes the last trading day on or before it
+    with span("yahoo.asfreq"):
+        calendar = pd.date_range(dates[0], dates[-1], freq=freq, name="Date")
+        positions = dates.get_indexer(calendar, method="ffill")
+
+        data = {"Date": dates.take(positions)}
+        for col in df.columns.drop("Date"):
+            data[col] = df[col].to_numpy().take(positions)
+
+        return pd.DataFrame(data, index=calendar, copy=False)
+
+
+class YahooFetcher:
+    """Downloads EOD data from Yahoo Finance over one shared, pooled session
+
+    The crumb Yahoo requires is scraped once & reused until it expires or Yahoo
+    rejects it. Failed requests are retried with exponential backoff, and many
+    symbols can be downloaded at once on a bounded thread pool.
+    """
+
+    # Statuses worth retrying, everything else is returned as is
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, max_workers=8, crumb_ttl=3600, retries=3, backoff=0.5, timeout=30, price_dtype=np.float64,
+                 session_url="https://au.finance.yahoo.com/quote/{}/history",
+                 download_url="https://query1.finance.yahoo.com/v7/finance/download/{}"):
+        """
+        Args:
+            max_workers (int, optional): Defaults to 8. Concurrent downloads & pooled connections
+            crumb_ttl (int, optional): Defaults to 3600. Seconds to reuse a crumb for
+            retries (int, optional): Defaults to 3. Retries for connection errors, timeouts & retryable statuses
+            backoff (float, optional): Defaults to 0.5. Seconds to wait before the first retry, doubling each time
+            timeout (float, optional): Defaults to 30. Seconds to wait on a connection or response before retrying
+            price_dtype (numpy.dtype, optional): Defaults to numpy.float64. Dtype prices are parsed as
+            session_url (str, optional): Quote page scraped for the crumb, formatted with the symbol
+            download_url (str, optional): Download endpoint, formatted with the symbol
+        """
+
+        self.max_workers = max_workers
+        self.crumb_ttl = crumb_ttl
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.price_dtype = price_dtype
+        self.session_url = session_url
+        self.download_url = download_url
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._crumb = None
+        self._crumb_expiry = 0
+        self._crumb_lock = threading.Lock()
+
+    def _get(self, url):
+        """GET with retries & exponential backoff"""
+
+        for attempt in range(self.retries + 1):
+            count("yahoo.requests")
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+            else:
+                if response.status_code not in self.RETRY_STATUSES or attempt == self.retries:
+                    count("yahoo.bytes_fetched", len(response.content))
+                    return response
+
+            count("yahoo.retries")
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def crumb(self, symbol, refresh=False):
+        """Crumb required for each download, scraped from a quote page if needed
+
+        Args:
+            symbol (str): Symbol whose quote page is scraped if a new crumb is needed
+            refresh (bool, optional): Defaults to False. Ignore any cached crumb
+
+        Returns:
+            str: Yahoo crumb
+        """
+
+        with self._crumb_lock:
+            if refresh or self._crumb is None or time.time() >= self._crumb_expiry:
+                with span("yahoo.crumb"):
+                    yahoo_session = self._get(self.session_url.format(symbol))
+
+                    yahoo_crumb = re.findall('"CrumbStore":{"crumb":"(.+?)"}', yahoo_session.text)
+                    if len(yahoo_crumb) == 0:
+                        raise ValueError("No crumb found. Probably couldn't find your symbol.")
+
+                    self._crumb = yahoo_crumb[0]
+                    self._crumb_expiry = time.time() + self.crumb_ttl
+            else:
+                count("yahoo.crumb_cache_hits")
+
+            return self._crumb
+
+    def download(self, symbol, start_date, end_date, interval, events):
+        """Downloads a csv from the yahoo finance download data endpoint
+
+        Args:
+            symbol (str): Ticker symbol+including exchange. Eg "AFI.AX"
+            start_date (str): Date in format of YYYY-MM-DD
+            end_date (str): Date in format of YYYY-MM-DD
+            interval (str): Yahoo interval, eg "1d"
+            events (str): Yahoo event type, eg "history" or "div"
+
+        Returns:
+            bytes: Raw csv
+        """
+
+        def download(crumb):
+            final_url = "{}?period1={}&period2={}&interval={}&events={}&crumb={}".format(
+                self.download_url.format(symbol),
+                time_str_to_unix(start_date),
+                time_str_to_unix(end_date),
+                interval,
+                events,
+                crumb,
+            )
+            return self._get(final_url)
+
+        crumb = self.crumb(symbol)
+        with span("yahoo.download"):
+            response = download(crumb)
+
+        # Crumb has most likely expired, so grab a fresh one & try again
+        if response.status_code == 401:
+            crumb = self.crumb(symbol, refresh=True)
+            with span("yahoo.download"):
+                response = download(crumb)
+
+        if response.status_code == 404:
+            returned_error = response.json()["chart"]["error"]["description"]
+            raise ValueError("From Yahoo: {}".format(returned_error))
 
-    if response.status_code == 404:
-        returned_error = response.json()["chart"]["error"]["description"]
-        raise ValueError("From Yahoo: {}".format(returned_error))
+        if response.status_code == 401:
+            returned_error = response.json()["finance"]["error"]["description"]
+            raise ValueError("From Yahoo: {}".format(returned_error))
 
-    if response.status_code == 401:
-        returned_error = response.json()["finance"]["error"]["description"]
-        raise ValueError("From Yahoo: {}".format(returned_error))
+        elif response.status_code == 200:
+            return response.content
 
-    elif response.status_code == 200:
+        else:
+            raise ValueError("From Yahoo: Unexpected status code {}".format(response.status_code))
 
-        # Extract data into DF
-        response_data = StringIO(response.text)
-        df = pd.read_csv(response_data)
+    def get_history(self, symbol, start_date, end_date, frequency):
+        """Downloads EOD data from the yahoo finance download data endpoint
 
-        df["Date"] = pd.to_datetime(df["Date"])
+        Args:
+            symbol (str): Ticker symbol+including exchange. Eg "AFI.AX"
+            start_date (str): Date in format of YYYY-MM-DD
+            end_date (str): Date in format of YYYY-MM-DD
+            frequency (str): Aggregate level. Options are:
+                - daily
+                - weekly
+                - monthly
 
-        # Fix up timestamp as well
-        df.index = pd.DatetimeIndex(df["Date"])
-        df = df.asfreq(freq=freq, method="ffill")
+        Returns:
+            pandas.core.frame.DataFrame: EOD data
+        """
+
+        interval, freq = yahoo_frequency(frequency)
+        content = self.download(symbol, start_date, end_date, interval, "history")
+
+        return parse_yahoo_csv(content, freq, self.price_dtype)
+
+    def get_dividends(self, symbol, start_date, end_date):
+        """Downloads dividend events from the yahoo finance download data endpoint
+
+        Args:
+            symbol (str): Ticker symbol+including exchange. Eg "AFI.AX"
+            start_date (str): Date in format of YYYY-MM-DD
+            end_date (str): Date in format of YYYY-MM-DD
+
+        Returns:
+            pandas.Series: Dividend per share, indexed by ex-dividend date
+        """
+
+        content = self.download(symbol, start_date, end_date, "1d", "div")
+        with span("yahoo.read_csv"):
+            df = pd.read_csv(BytesIO(content), dtype={"Dividends": np.float64}, na_values=["null"])
+        count("yahoo.rows_parsed", len(df))
+
+        dates = pd.DatetimeIndex(pd.to_datetime(df["Date"].to_numpy(), format="%Y-%m-%d"), name="Date")
+        return pd.Series(df["Dividends"].to_numpy(), index=dates, name="Dividends").sort_index()
+
+    def get_many(self, symbols, start_date, end_date, frequency, errors="raise"):
+        """Downloads many symbols concurrently
+
+        Args:
+            symbols (list): Ticker symbols+including exchange. Eg ["AFI.AX", "ARG.AX"]
+            start_date (str): Date in format of YYYY-MM-DD
+            end_date (str): Date in format of YYYY-MM-DD
+            frequency (str): daily, weekly or monthly
+            errors (str, optional): Defaults to "raise". Either:
+                - raise: Any symbol failing to download stops the run
+                - ignore: Failing symbols are left out of the results
+
+        Returns:
+            dict: EOD data for each symbol
+        """
+
+        if errors not in ("raise", "ignore"):
+            raise ValueError("Please provide a valid errors option. The options are raise or ignore")
+
+        def fetch(symbol):
+            try:
+                return self.get_history(symbol, start_date, end_date, frequency)
+            except Exception:
+                if errors == "raise":
+                    raise
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = dict(zip(symbols, pool.map(fetch, symbols)))
+
+        return {symbol: df for symbol, df in results.items() if df is not None}
+
+
+_default_fetcher = None
+_default_fetcher_lock = threading.Lock()
+
+
+def default_fetcher():
+    """Fetcher shared by get_yahoo_history, created on first use
+
+    Returns:
+        YahooFetcher: Shared fetcher
+    """
+
+    global _default_fetcher
+
+    with _default_fetcher_lock:
+        if _default_fetcher is None:
+            _default_fetcher = YahooFetcher()
+
+    return _default_fetcher
+
+
+def get_yahoo_history(symbol, start_date, end_date, frequency):
+    """Scrapes data from the yahoo finance download data endpoint
+
+    Uses a shared YahooFetcher, so the session & crumb are reused between calls
+
+    Args:
+        symbol (str): Ticker symbol+including exchange. Eg "AFI.AX"
+        start_date (str): Date in format of YYYY-MM-DD
+        end_date (str): Date in format of YYYY-MM-DD
+        frequency (str): Aggregate level. Options are:
+            - daily
+            - weekly
+            - monthly
+
+    Returns:
+        pandas.core.frame.DataFrame: EOD data
+    """
+
+    return default_fetcher().get_history(symbol, start_date, end_date, frequency)
+
+
+def get_yahoo_dividends(symbol, start_date, end_date):
+    """Scrapes dividend events from the yahoo finance download data endpoint
+
+    Args:
+        symbol (str): Ticker symbol+including exchange. Eg "AFI.AX"
+        start_date (str): Date in format of YYYY-MM-DD
+        end_date (str): Date in format of YYYY-MM-DD
+
+    Returns:
+        pandas.Series: Dividend per share, indexed by ex-dividend date
+    """
 
-        return df
+    return default_fetcher().get_dividends(symbol, start_date, end_date)
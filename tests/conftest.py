@@ -0,0 +1,6 @@
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ("dividends_vs_growth", "margin_call_analysis"):
+    sys.path.insert(0, os.path.join(REPO_DIR, directory))
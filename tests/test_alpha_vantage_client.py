@@ -0,0 +1,45 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from alpha_vantage_client import AlphaVantageClient
+
+
+class FakeTimeSeries:
+    """Stands in for alpha_vantage's TimeSeries, counting calls"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def get_daily(self, symbol, outputsize="full"):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        return pd.DataFrame({"date": pd.date_range("2020-01-01", periods=3), "4. close": [1.0, 2.0, 3.0]}), {}
+
+    get_weekly = get_monthly = get_daily
+
+
+def test_bad_time_slice_doesnt_use_quota():
+    client = AlphaVantageClient(None, requests_per_period=1, period=3600, timeseries=FakeTimeSeries())
+
+    with pytest.raises(ValueError):
+        client.get("hourly", "ABC")
+
+    assert client.bucket._tokens == 1
+    assert client._request_locks == {}
+
+
+def test_concurrent_requests_fetch_once_and_release_locks():
+    ts = FakeTimeSeries(delay=0.05)
+    client = AlphaVantageClient(None, timeseries=ts)
+
+    frames = client.get_many(["ABC"] * 4 + ["XYZ"], "daily", max_workers=5)
+
+    assert ts.calls == 2
+    assert len(frames) == 2
+    assert client._request_locks == {}
@@ -0,0 +1,16 @@
+import numpy as np
+import pytest
+
+from bootstrap import block_bootstrap_margin_calls
+from helpers import create_margin_call_range_table
+
+
+def test_needs_at_least_one_path():
+    prices = np.exp(np.cumsum(np.random.default_rng(0).normal(0, 0.01, 500)))
+    lvr_lookup = create_margin_call_range_table(0.7, buffer=0.1, step_size=0.1)
+
+    with pytest.raises(ValueError):
+        block_bootstrap_margin_calls(prices, lvr_lookup, n_paths=0, processes=1)
+
+    df = block_bootstrap_margin_calls(prices, lvr_lookup, n_paths=10, seed=0, processes=1)
+    assert df["mc_probability"].between(0, 1).all()
@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from drawdown import (DrawdownTracker, LVRTracker, MarginLoanMonitor, RangeMaxIndex, RollingMax,
+                      count_margin_call_episodes, drawdown_matrix, entry_date_lvr_backtest,
+                      margin_call_episodes, rolling_max)
+from helpers import calc_drawdown, calc_lvr, create_margin_call_range_table
+
+
+N = 300
+# Single bar, powers of 2 either side, the full history & longer than it
+WINDOWS = [1, 2, 3, 7, 8, 9, 64, N - 1, N, N + 5, None]
+
+
+def _prices(n=N, seed=0):
+    """Price history with leading, isolated & consecutive gaps plus a bad zero price"""
+
+    prices = 10 * np.exp(np.cumsum(np.random.default_rng(seed).normal(0, 0.03, n)))
+    prices[:3] = np.nan
+    prices[[x for x in (50, 100, 101, 102, 299) if x < n]] = np.nan
+    prices[90] = 0.0
+    return prices
+
+
+def _pandas_rolling_max(prices, window_size):
+    return pd.Series(prices).rolling(window=window_size or len(prices), min_periods=1).max().to_numpy()
+
+
+def _calc_drawdown(prices, window_size):
+    df = pd.DataFrame({"Close": prices})
+    return calc_drawdown(df, "Close", window_size or len(prices))["market_drawdown"].to_numpy()
+
+
+@pytest.mark.parametrize("window_size", WINDOWS)
+def test_range_max_index_rolling_max_matches_pandas(window_size):
+    prices = _prices()
+
+    np.testing.assert_array_equal(RangeMaxIndex(prices).rolling_max(window_size), _pandas_rolling_max(prices, window_size))
+
+
+def test_range_max_matches_nanmax():
+    prices = _prices()
+    rng = np.random.default_rng(1)
+    start = rng.integers(3, N, 1000)
+    end = np.minimum(start + rng.integers(0, 80, 1000), N - 1)
+
+    expected = [np.nanmax(prices[i:j + 1]) if not np.isnan(prices[i:j + 1]).all() else np.nan for i, j in zip(start, end)]
+    np.testing.assert_array_equal(RangeMaxIndex(prices).range_max(start, end), expected)
+
+
+@pytest.mark.parametrize("window_size", WINDOWS)
+def test_vectorised_rolling_max_matches_pandas(window_size):
+    paths = np.stack([_prices(seed=seed) for seed in range(4)])
+
+    expected = np.stack([_pandas_rolling_max(x, window_size) for x in paths])
+    np.testing.assert_array_equal(rolling_max(paths, window_size), expected)
+
+
+@pytest.mark.parametrize("window_size", WINDOWS)
+def test_streaming_rolling_max_matches_pandas(window_size):
+    prices = _prices()
+    tracker = RollingMax(window_size)
+
+    np.testing.assert_array_equal([tracker.update(x) for x in prices], _pandas_rolling_max(prices, window_size))
+
+
+def test_drawdown_matrix_matches_calc_drawdown():
+    prices = pd.Series(_prices(), index=pd.bdate_range("2000-01-03", periods=N))
+
+    df = drawdown_matrix(prices, WINDOWS)
+
+    assert df.index.equals(prices.index)
+    for window_size in WINDOWS:
+        expected = _calc_drawdown(prices.to_numpy(), window_size)
+        np.testing.assert_allclose(df["all" if window_size is None else window_size], expected, rtol=1e-12, atol=1e-12)
+
+
+@pytest.mark.parametrize("window_size", [1, 9, N, None])
+def test_streaming_drawdown_matches_calc_drawdown(window_size):
+    prices = _prices()
+    tracker = DrawdownTracker(window_size)
+
+    np.testing.assert_allclose([tracker.update(x) for x in prices], _calc_drawdown(prices, window_size),
+                               rtol=1e-12, atol=1e-12)
+
+
+def test_lvr_tracker_matches_calc_lvr():
+    prices = _prices()
+    df = pd.DataFrame({"date": pd.bdate_range("2000-01-03", periods=N), "close": prices})
+    expected = calc_lvr(df, 100000, 0.5)
+
+    tracker = LVRTracker.from_investment(100000, 0.5, prices[3], base_lvr=0.7)
+    lvrs = [tracker.update(x) for x in prices]
+
+    np.testing.assert_allclose(lvrs, expected["lvr"], rtol=1e-12)
+
+
+def test_monitor_streaming_matches_batch():
+    prices = _prices()
+    dates = pd.bdate_range("2000-01-03", periods=N)
+    lvr = LVRTracker.from_investment(100000, 0.6, prices[3], base_lvr=0.7)
+
+    batch = MarginLoanMonitor(lvr.holdings, lvr.loan, 0.7, drawdown_window=20).update_many(dates, prices)
+
+    # Warmed up with history, then fed bar by bar
+    monitor = MarginLoanMonitor(lvr.holdings, lvr.loan, 0.7, drawdown_window=20)
+    warm_up = monitor.update_many(dates[:150], prices[:150])
+    live = pd.DataFrame([monitor.update(date, float(price)) for date, price in zip(dates[150:], prices[150:])])
+
+    pd.testing.assert_frame_equal(pd.concat([warm_up, live], ignore_index=True), batch)
+    np.testing.assert_allclose(batch["market_drawdown"], _calc_drawdown(prices, 20), rtol=1e-12, atol=1e-12)
+    assert (batch["margin_call"] == (batch["lvr"] > 0.7)).all()
+
+
+def test_entry_date_backtest_matches_calc_lvr_from_each_entry():
+    prices = _prices(n=120)
+    df = pd.DataFrame({"date": pd.bdate_range("2000-01-03", periods=120), "close": prices})
+    initial_lvrs = [0.3, 0.5, 0.7]
+
+    peak_lvr, margin_call = entry_date_lvr_backtest(df, 100000, initial_lvrs, base_lvr=0.7, buffer=0.05)
+
+    for entry in range(len(df)):
+        for initial_lvr in initial_lvrs:
+            if not prices[entry] > 0:
+                assert np.isnan(peak_lvr[initial_lvr].iloc[entry])
+                continue
+
+            expected = calc_lvr(df.iloc[entry:], 100000, initial_lvr)["lvr"].max()
+            assert peak_lvr[initial_lvr].iloc[entry] == pytest.approx(expected, rel=1e-12)
+            assert margin_call[initial_lvr].iloc[entry] == (expected > 0.75)
+
+
+def _loop_episodes(drawdowns, triggers):
+    """Plain loop over bars finding each run beyond each trigger"""
+
+    episodes = []
+    for level, trigger in enumerate(triggers):
+        bar = 0
+        while bar < len(drawdowns):
+            if not -drawdowns[bar] > trigger:
+                bar += 1
+                continue
+
+            start = bar
+            while bar < len(drawdowns) and -drawdowns[bar] > trigger:
+                bar += 1
+            trough = start + int(np.nanargmin(drawdowns[start:bar]))
+            recovery = next((i for i in range(trough, len(drawdowns)) if drawdowns[i] >= 0), -1)
+            episodes.append((level, start, trough, bar - 1, recovery))
+
+    return episodes
+
+
+def test_margin_call_episodes_match_loop():
+    drawdowns = drawdown_matrix(_prices(n=2000, seed=3), [60])[60].to_numpy()
+    lvr_lookup = create_margin_call_range_table(0.7, buffer=0.1, step_size=0.1)
+
+    df = margin_call_episodes(drawdowns, lvr_lookup)
+    expected = _loop_episodes(drawdowns, lvr_lookup["mc_trigger"].to_numpy())
+
+    assert len(df) > 0
+    levels = lvr_lookup["lvr"].to_numpy()
+    actual = list(zip(df["lvr"], df["start"], df["trough"], df["end"], df["recovery"]))
+    assert actual == [(levels[x[0]],) + x[1:] for x in expected]
+
+    counts = count_margin_call_episodes(drawdowns, lvr_lookup["mc_trigger"])
+    np.testing.assert_array_equal(counts, np.bincount([x[0] for x in expected], minlength=len(lvr_lookup)))
+
+
+def test_episodes_merge_brief_recoveries():
+    drawdowns = np.array([0, -20, -30, -5, -25, 0, -5, -40, -10, 0], dtype=np.float64)
+
+    assert count_margin_call_episodes(drawdowns, [15])[0] == 3
+    assert count_margin_call_episodes(drawdowns, [15], merge_within=1)[0] == 2
+    assert count_margin_call_episodes(drawdowns, [15], merge_within=3)[0] == 1
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from GrowthCalculator import GrowthCalculator, InvestmentHistory, calculate_growth_batch
+
+
+def _history():
+    history = InvestmentHistory(4)
+    for year in range(4):
+        history.append(year, 90000.0, 100.0 * year, 10.0 * year, 1000.0 * year)
+    return history
+
+
+def test_indexing_and_iterating_yield_dicts():
+    history = _history()
+
+    assert history[2] == {'year': 2, 'salary': 90000.0, 'dividend_income': 200.0, 'excess_tax': 20.0, 'capital': 2000.0}
+    assert history[-1]['year'] == 3
+    assert [x['year'] for x in history] == [0, 1, 2, 3]
+
+
+def test_slicing_views_the_same_arrays():
+    history = _history()
+
+    view = history[1:3]
+
+    assert isinstance(view, InvestmentHistory)
+    assert len(view) == 2
+    assert [x['year'] for x in view] == [1, 2]
+    assert np.shares_memory(view.capital, history.capital)
+    assert list(history[::2].to_frame()['year']) == [0, 2]
+
+
+def test_calculate_growth_records_every_year():
+    g = GrowthCalculator(90000, 100000, 0.06, 0.04, 10)
+    g.calculate_growth(final_year_liquidation=True)
+
+    assert len(g.investment_history) == 11
+
+
+SCENARIOS = [
+    (90000, 100000, 0.06, 0.04, 10),
+    (150000, 50000, 0.03, 0.05, 1),
+    (40000, 200000, 0.08, 0.0, 30),
+    (18000, 25000, -0.05, 0.07, 7),
+    (250000, 500000, 0.1, 0.02, 15),
+]
+
+
+# None uses the default schedule. The rest start before the earliest schedule, straddle
+# rate changes & run past the last schedule on file
+@pytest.mark.parametrize("start_year", [None, 2010, 2016, 2020, 2026])
+@pytest.mark.parametrize("final_year_liquidation", [False, True])
+def test_batch_matches_scalar_calculator(start_year, final_year_liquidation):
+    batch = calculate_growth_batch(*map(np.array, zip(*SCENARIOS)), final_year_liquidation=final_year_liquidation,
+                                   start_year=start_year)
+
+    for i, scenario in enumerate(SCENARIOS):
+        g = GrowthCalculator(*scenario, start_year=start_year)
+        g.calculate_growth(final_year_liquidation=final_year_liquidation)
+
+        for field, value in g.summarised.items():
+            assert batch[field].iloc[i] == pytest.approx(value, abs=0.011), (scenario, field)
+
+
+@pytest.mark.parametrize("start_year", [None, 2016])
+def test_liquidation_curve_matches_selling_up_each_year(start_year):
+    salary, starting_investment, capital_growth, dividend_payout, years = 90000, 100000, 0.07, 0.04, 25
+    curve = GrowthCalculator(salary, starting_investment, capital_growth, dividend_payout, years,
+                             start_year=start_year).liquidation_curve()
+
+    assert [x['year'] for x in curve] == list(range(1, years + 1))
+    for point in curve:
+        g = GrowthCalculator(salary, starting_investment, capital_growth, dividend_payout, point['year'],
+                             start_year=start_year)
+        g.calculate_growth(final_year_liquidation=True)
+
+        assert point['final_position'] == pytest.approx(g.summarised['Final Position'], abs=0.011)
+        assert point['capital'] - point['liquidation_tax'] == pytest.approx(g.investment_history[-1]['capital'])
+
+
+def test_deprecated_helpers_still_work():
+    g = GrowthCalculator(90000, 100000, 0.06, 0.04, 10)
+
+    with pytest.warns(DeprecationWarning):
+        assert g.compound_interest(100, 0.1, 1, 2) == pytest.approx(121)
+
+    # Only the gain on parcels held for more than a year is discounted
+    with pytest.warns(DeprecationWarning):
+        assert g.taxable_capital_gains(100000, 1) == pytest.approx(6000)
+    with pytest.warns(DeprecationWarning):
+        assert g.taxable_capital_gains(100000, 5) == pytest.approx((100000 * 1.06 ** 5 - 100000) / 2)
+
+
+def test_eoy_stats_is_the_history_as_dicts():
+    g = GrowthCalculator(90000, 100000, 0.06, 0.04, 3)
+    assert g.eoy_stats == []
+
+    g.calculate_growth()
+
+    assert g.eoy_stats == list(g.investment_history)
+    assert g.eoy_stats[0] == {'year': 0, 'salary': 90000.0, 'dividend_income': 0.0, 'excess_tax': 0.0, 'capital': 100000.0}
+    with pytest.raises(AttributeError):
+        g.eoy_stats = []
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from helpers import count_margin_calls, create_margin_call_range_table
+
+
+def baseline_count_margin_calls(drawdowns, lvr_lookup):
+    """The original per LVR loop from margin_call_samples"""
+
+    mc_counts = list()
+    for row, col in lvr_lookup.iterrows():
+        margin_calls = pd.Series(drawdowns).apply(
+            lambda x: 1 if abs(x) > col["mc_trigger"] and x < 1 else 0
+        )
+
+        counts = margin_calls.value_counts()
+        mc_count = counts[1] if (len(counts) > 1) else 0
+        mc_counts.append(mc_count)
+
+    return mc_counts
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_count_margin_calls_matches_baseline_loop(seed):
+    rng = np.random.default_rng(seed)
+    lvr_lookup = create_margin_call_range_table(0.7, buffer=0.1, step_size=0.05)
+    triggers = lvr_lookup["mc_trigger"].to_numpy()
+
+    drawdowns = -np.abs(rng.normal(0, 20, 2000))
+    # New highs, ties exactly at each trigger, small rises & gaps
+    drawdowns[:10] = 0.0
+    drawdowns[10:10 + len(triggers)] = -triggers
+    drawdowns[100:110] = rng.uniform(0, 1, 10)
+    drawdowns[200:250] = np.nan
+    rng.shuffle(drawdowns)
+
+    counts = count_margin_calls(drawdowns, lvr_lookup["mc_trigger"])
+
+    np.testing.assert_array_equal(counts, baseline_count_margin_calls(drawdowns, lvr_lookup))
+
+
+def test_count_margin_calls_ties_and_nans():
+    drawdowns = [0.0, -10.0, -10.0, -10.000001, np.nan, -25.0]
+
+    np.testing.assert_array_equal(count_margin_calls(drawdowns, [10.0, 25.0, 0.0]), [2, 0, 4])
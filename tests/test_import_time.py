@@ -0,0 +1,47 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Seconds allowed for an import on top of numpy & pandas, loose enough not to be flaky
+BUDGET = 0.25
+
+IMPORT_SCRIPT = """
+import json, sys, time
+import numpy, pandas
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [x for x in {heavy!r} if x in sys.modules]}}))
+"""
+
+
+def import_in_fresh_interpreter(module, directory, heavy, runs=3):
+    """Fastest import of a module in a fresh interpreter & the heavy dependencies it loaded"""
+
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT.format(module=module, heavy=heavy)],
+            cwd=os.path.join(REPO_DIR, directory), capture_output=True, text=True, check=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    return min(results, key=lambda x: x["seconds"])
+
+
+@pytest.mark.parametrize("module, directory, heavy", [
+    ("helpers", "margin_call_analysis", ["requests", "alpha_vantage", "plotly"]),
+    ("plotly_utilities", "margin_call_analysis", ["plotly"]),
+    ("alpha_vantage_client", "margin_call_analysis", ["alpha_vantage"]),
+])
+def test_heavy_dependencies_deferred(module, directory, heavy):
+    result = import_in_fresh_interpreter(module, directory, heavy)
+
+    assert result["loaded"] == []
+    assert result["seconds"] < BUDGET
@@ -0,0 +1,109 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from margin_loan import simulate_margin_loan
+
+
+def reference_margin_loan(df, initial_investment, initial_lvr, base_lvr, buffer=0.0, interest_rate=0.0,
+                          capitalise_interest=True, dividends=None, drp=True, cure="sell"):
+    """Plain bar by bar loop following simulate_margin_loan's rules"""
+
+    prices = df["close"].to_numpy(dtype=np.float64)
+    dates = pd.DatetimeIndex(df["date"])
+    n = len(prices)
+    trigger = base_lvr + buffer
+
+    start = int(np.flatnonzero(prices > 0)[0])
+    borrowed = initial_investment / (1 - initial_lvr) * initial_lvr
+    holdings = math.floor((initial_investment + borrowed) / prices[start])
+    loan = borrowed
+    drp_balance = 0.0
+
+    dividend_per_share = np.zeros(n)
+    for ex_date, amount in (dividends.items() if dividends is not None else []):
+        bar = int(np.searchsorted(dates, ex_date))
+        if start < bar < n:
+            dividend_per_share[bar] += amount
+
+    rows = []
+    for i in range(start, n):
+        price = prices[i]
+        interest = dividend = top_up = sold = 0.0
+
+        if i > start:
+            days = (dates[i] - dates[i - 1]).days
+            interest = loan * ((1 + interest_rate / 365) ** days - 1)
+            if capitalise_interest:
+                loan += interest
+
+            if dividend_per_share[i] > 0:
+                dividend = holdings * dividend_per_share[i]
+                if drp:
+                    drp_balance += dividend
+                    if price > 0:
+                        shares = math.floor(drp_balance / price)
+                        holdings += shares
+                        drp_balance -= shares * price
+
+        if price > 0:
+            lvr = loan / (holdings * price) if holdings > 0 else math.inf
+            margin_call = lvr > trigger
+            if margin_call and holdings > 0 and cure is not None and i > start:
+                if cure == "sell":
+                    sold = min(holdings, math.ceil((loan - base_lvr * holdings * price) / (price * (1 - base_lvr))))
+                    holdings -= sold
+                    loan -= sold * price
+                else:
+                    top_up = loan - base_lvr * holdings * price
+                    loan -= top_up
+                lvr = loan / (holdings * price) if holdings > 0 else math.inf
+        else:
+            lvr, margin_call = np.nan, False
+
+        rows.append((holdings, loan, lvr, interest, dividend, margin_call, top_up, sold))
+
+    out = pd.DataFrame(rows, columns=["holdings", "loan", "lvr", "interest", "dividends", "margin_call",
+                                      "top_up", "shares_sold"], index=range(start, n))
+    return out
+
+
+def _history(n=400, seed=0, nan_bars=()):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2010-01-01", periods=n)
+    close = 10 * np.exp(np.cumsum(rng.normal(-0.002, 0.03, n)))
+    close[list(nan_bars)] = np.nan
+    return pd.DataFrame({"date": dates, "close": close})
+
+
+@pytest.mark.parametrize("cure", ["sell", "topup", None])
+@pytest.mark.parametrize("capitalise_interest", [True, False])
+def test_matches_bar_by_bar_loop(cure, capitalise_interest):
+    df = _history(nan_bars=[50, 51, 200])
+    # One ex-date lands on a bar without a price
+    dividends = pd.Series([0.2, 0.3, 0.25], index=df["date"].iloc[[30, 200, 300]])
+
+    kwargs = dict(initial_investment=100000, initial_lvr=0.6, base_lvr=0.7, buffer=0.05, interest_rate=0.07,
+                  capitalise_interest=capitalise_interest, dividends=dividends, cure=cure)
+    result = simulate_margin_loan(df, **kwargs)
+    expected = reference_margin_loan(df, **kwargs)
+
+    assert result["margin_call"].any()
+    for col in expected.columns:
+        np.testing.assert_allclose(result[col].to_numpy(dtype=np.float64), expected[col].to_numpy(dtype=np.float64),
+                                   rtol=1e-9, err_msg=col)
+
+
+@pytest.mark.parametrize("cure", ["sell", "topup", None])
+def test_nan_price_on_event_bar_is_a_gap(cure):
+    df = _history(n=100, nan_bars=[40])
+    dividends = pd.Series([0.5], index=df["date"].iloc[[40]])
+
+    result = simulate_margin_loan(df, 100000, 0.6, 0.7, dividends=dividends, cure=cure)
+
+    assert not result["margin_call"].iloc[40]
+    assert np.isnan(result["lvr"].iloc[40])
+    assert result["holdings"].iloc[40] == result["holdings"].iloc[39]
+    assert np.isfinite(result["loan"].iloc[41:]).all()
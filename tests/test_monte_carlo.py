@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from monte_carlo import NormalReturns, monte_carlo_growth
+
+
+def test_normal_returns_cant_lose_more_than_everything():
+    capital_growth, dividend_payout = NormalReturns(0.0, 2.0, 0.04, 0.1).sample(np.random.default_rng(0), 1000, 10)
+
+    assert capital_growth.min() == -1.0
+    assert dividend_payout.min() == 0.0
+
+
+def test_needs_at_least_one_path():
+    with pytest.raises(ValueError):
+        monte_carlo_growth(90000, 100000, 5, NormalReturns(0.06, 0.1, 0.04), n_paths=0, processes=1)
+
+    df = monte_carlo_growth(90000, 100000, 5, NormalReturns(0.06, 0.1, 0.04), n_paths=1, seed=0, processes=1)
+    assert len(df) == 5
+
+
+def test_wiped_out_paths_dont_poison_percentiles():
+    # Volatile enough that some years lose everything & get floored at -100%
+    df = monte_carlo_growth(90000, 100000, 30, NormalReturns(0.07, 0.6, 0.04), n_paths=5000,
+                            final_year_liquidation=True, seed=0, processes=1)
+
+    assert np.isfinite(df.to_numpy()).all()
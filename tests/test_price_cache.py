@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+
+from price_cache import PriceCache
+from yahoo_finance import YahooFetcher
+from yahoo_stand_in import YahooStandIn
+
+
+@pytest.fixture
+def server():
+    server = YahooStandIn()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def fetcher(server):
+    return YahooFetcher(session_url=server.session_url, download_url=server.download_url, backoff=0)
+
+
+@pytest.fixture
+def cache(tmp_path, fetcher):
+    return PriceCache(str(tmp_path), fetch=fetcher.get_history)
+
+
+def test_first_request_matches_download(cache, fetcher):
+    cached = cache.get_history("TEST.AX", "2001-01-01", "2001-06-30", "daily")
+    uncached = fetcher.get_history("TEST.AX", "2001-01-01", "2001-06-30", "daily")
+
+    pd.testing.assert_frame_equal(cached, uncached, check_freq=False)
+
+
+def test_repeat_request_served_from_disk(cache, server):
+    cache.get_history("TEST.AX", "2001-01-01", "2001-06-30", "daily")
+    downloads = server.requests["download"]
+
+    cache.get_history("TEST.AX", "2001-02-01", "2001-05-31", "daily")
+
+    assert server.requests["download"] == downloads
+
+
+@pytest.mark.parametrize("frequency", ["daily", "weekly"])
+def test_top_up_seams_match_single_download(cache, fetcher, frequency):
+    # Cached middle, then extended both ways, so the result is joined from three downloads
+    cache.get_history("TEST.AX", "2001-01-01", "2001-06-01", frequency)
+    cached = cache.get_history("TEST.AX", "2000-06-01", "2001-12-31", frequency)
+    uncached = fetcher.get_history("TEST.AX", "2000-06-01", "2001-12-31", frequency)
+
+    pd.testing.assert_frame_equal(cached, uncached, check_freq=False)
+
+
+def test_top_up_only_downloads_missing_dates(cache, server):
+    cache.get_history("TEST.AX", "2001-01-01", "2001-06-01", "daily")
+    downloads = server.requests["download"]
+
+    cache.get_history("TEST.AX", "2001-01-01", "2001-07-01", "daily")
+
+    assert server.requests["download"] == downloads + 1
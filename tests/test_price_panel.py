@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from price_panel import PricePanel
+
+
+def _frame(dates, close):
+    return pd.DataFrame({"date": pd.DatetimeIndex(dates), "close": close})
+
+
+def test_build_forward_fills_within_each_history(tmp_path):
+    frames = {
+        "AAA": _frame(["2020-01-01", "2020-01-02", "2020-01-06"], [1.0, 2.0, 3.0]),
+        "BBB": _frame(["2020-01-02", "2020-01-03"], [10.0, 11.0]),
+    }
+
+    panel = PricePanel.build(str(tmp_path), frames)
+
+    np.testing.assert_array_equal(panel.series("AAA"), [1.0, 2.0, 2.0, 3.0])
+    np.testing.assert_array_equal(panel.series("BBB"), [np.nan, 10.0, 11.0, np.nan])
+
+
+def test_build_keeps_symbols_without_prices(tmp_path):
+    frames = {
+        "AAA": _frame(["2020-01-01", "2020-01-02"], [1.0, 2.0]),
+        "NAN": _frame(["2020-01-01", "2020-01-02"], [np.nan, np.nan]),
+    }
+
+    panel = PricePanel.build(str(tmp_path), frames)
+
+    assert "NAN" in panel
+    assert np.isnan(panel.series("NAN")).all()
+    assert len(panel.frame("NAN")) == 0
+    np.testing.assert_array_equal(panel.series("AAA"), [1.0, 2.0])
@@ -0,0 +1,46 @@
+import numpy as np
+
+from tax_calculator import DEFAULT_FIN_YEAR, TAX_SCHEDULES, CGTLedger, tax, tax_array
+
+
+def test_default_year_unchanged():
+    assert DEFAULT_FIN_YEAR == 2019
+    assert tax(100000) == tax(100000, 2019) == 24497.0
+
+
+def test_arrays_bypass_cache():
+    incomes = np.array([0, 18200, 50000, 100000, 250000], dtype=np.float64)
+
+    np.testing.assert_array_equal(tax(incomes), [tax(x) for x in incomes])
+    np.testing.assert_array_equal(tax(incomes, 2018), tax_array(incomes, 2018))
+
+
+def test_years_before_data_use_earliest_schedule():
+    earliest = TAX_SCHEDULES.years[0]
+
+    assert TAX_SCHEDULES.resolve_year(2000) == earliest
+    assert tax(50000, 2000) == tax(50000, earliest)
+
+
+def test_ledger_restarts_after_a_wipe_out():
+    ledger = CGTLedger(1000.0)
+    ledger.grow(-1.0)
+    ledger.buy(100.0)
+    ledger.grow(0.5)
+
+    # The first parcel is a total loss, the new one gains 50%
+    assert ledger.taxable_capital_gains() == -1000.0 / 2 + 50.0
+
+    many = CGTLedger(np.array([1000.0, 1000.0]))
+    many.grow(np.array([-1.0, 0.1]))
+    many.buy(np.array([100.0, 100.0]))
+    many.grow(np.array([0.5, 0.5]))
+
+    np.testing.assert_allclose(many.taxable_capital_gains(), [-450.0, (1650.0 - 1000.0) / 2 + 50.0])
+
+
+def test_scalar_types_agree():
+    expected = TAX_SCHEDULES.schedule(2018).tax(np.array([85000.0]))[0]
+
+    for income in (85000, 85000.0, np.float64(85000), np.int64(85000), np.array(85000.0)):
+        assert tax(income, 2018) == expected
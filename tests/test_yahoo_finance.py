@@ -0,0 +1,117 @@
+import time
+
+import pytest
+import requests
+
+import yahoo_finance
+from yahoo_finance import YahooFetcher
+from yahoo_stand_in import YahooStandIn
+
+
+@pytest.fixture
+def server():
+    server = YahooStandIn(stall_seconds=1.0)
+    yield server
+    server.close()
+
+
+def _fetcher(server, **kwargs):
+    kwargs.setdefault("backoff", 0)
+    return YahooFetcher(session_url=server.session_url, download_url=server.download_url, **kwargs)
+
+
+def _history(fetcher, symbol="TEST.AX"):
+    return fetcher.get_history(symbol, "2001-01-01", "2001-03-31", "daily")
+
+
+def test_crumb_reused_until_it_expires(server):
+    fetcher = _fetcher(server, crumb_ttl=0.2)
+
+    _history(fetcher)
+    _history(fetcher)
+    assert server.requests["quote"] == 1
+
+    time.sleep(0.3)
+    assert len(_history(fetcher)) > 0
+    assert server.requests["quote"] == 2
+    assert server.requests["download"] == 3
+
+
+def test_rejected_crumb_is_refreshed(server):
+    fetcher = _fetcher(server)
+    _history(fetcher)
+
+    server.expire_crumb()
+
+    assert len(_history(fetcher)) > 0
+    assert server.requests["quote"] == 2
+    # The rejected download plus its retry with the new crumb
+    assert server.requests["download"] == 3
+
+
+def test_retryable_statuses_back_off_exponentially(server, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(yahoo_finance.time, "sleep", sleeps.append)
+    fetcher = _fetcher(server, retries=3, backoff=0.5)
+    fetcher.crumb("TEST.AX")
+
+    server.fail_downloads(503, 429, 502)
+
+    assert len(_history(fetcher)) > 0
+    assert sleeps == [0.5, 1.0, 2.0]
+    assert server.requests["download"] == 4
+
+
+def test_gives_up_after_retries(server):
+    fetcher = _fetcher(server, retries=2)
+    server.fail_downloads(503, 503, 503)
+
+    with pytest.raises(ValueError, match="503"):
+        _history(fetcher)
+
+    assert server.requests["download"] == 3
+
+
+def test_stalled_response_times_out_and_is_retried(server):
+    fetcher = _fetcher(server, timeout=0.2)
+    server.fail_downloads("stall")
+
+    start = time.perf_counter()
+    assert len(_history(fetcher)) > 0
+    assert time.perf_counter() - start < server.stall_seconds
+
+
+def test_stalled_responses_raise_once_retries_are_used_up(server):
+    fetcher = _fetcher(server, timeout=0.2, retries=1)
+    server.fail_downloads("stall", "stall")
+
+    with pytest.raises(requests.Timeout):
+        _history(fetcher)
+
+
+def test_unknown_symbol_raises(server):
+    with pytest.raises(ValueError, match="No data found"):
+        _history(_fetcher(server), "MISSING.AX")
+
+
+def test_get_many_shares_one_crumb(server):
+    symbols = ["A.AX", "B.AX", "C.AX", "D.AX"]
+
+    results = _fetcher(server, max_workers=4).get_many(symbols, "2001-01-01", "2001-03-31", "daily")
+
+    assert list(results.keys()) == symbols
+    assert server.requests["quote"] == 1
+
+
+def test_get_many_errors(server):
+    fetcher = _fetcher(server)
+    symbols = ["A.AX", "MISSING.AX", "B.AX"]
+
+    results = fetcher.get_many(symbols, "2001-01-01", "2001-03-31", "daily", errors="ignore")
+    assert list(results.keys()) == ["A.AX", "B.AX"]
+
+    with pytest.raises(ValueError, match="No data found"):
+        fetcher.get_many(symbols, "2001-01-01", "2001-03-31", "daily", errors="raise")
+
+    with pytest.raises(ValueError, match="errors option"):
+        fetcher.get_many(symbols, "2001-01-01", "2001-03-31", "daily", errors="warn")
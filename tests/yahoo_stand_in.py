@@ -0,0 +1,133 @@
+"""
+Title: Yahoo Stand-in Server
+Desc:  Local HTTP server mimicking Yahoo's quote page & csv download endpoint, for offline tests
+"""
+
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+
+# Trading days the server knows about, with a deterministic close for each
+TRADING_DAYS = pd.bdate_range("1999-01-01", "2003-12-31")
+CLOSES = np.round(10 * np.exp(np.cumsum(np.random.default_rng(0).normal(0, 0.01, len(TRADING_DAYS)))), 4)
+
+# Symbols starting with this are unknown to the server & get a 404
+MISSING_PREFIX = "MISSING"
+
+
+class YahooStandIn:
+    """Serves the quote page & csv downloads on localhost, counting requests made
+
+    Each quote page visit issues a new crumb, & downloads with anything but the
+    latest crumb are rejected with a 401. Failures can be queued up for downloads,
+    either a status code or "stall" to hang for stall_seconds before answering.
+    """
+
+    def __init__(self, stall_seconds=1.0):
+        self.requests = {"quote": 0, "download": 0}
+        self.crumbs_issued = 0
+        self.valid_crumb = None
+        self.stall_seconds = stall_seconds
+        self._failures = []
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path.startswith("/quote/"):
+                    status, body = server.quote()
+                else:
+                    status, body = server.download(url.path.rsplit("/", 1)[-1], parse_qs(url.query))
+
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up waiting on a stalled response
+                    pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.httpd.server_address[1]
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    @property
+    def session_url(self):
+        return "http://127.0.0.1:{}/quote/{{}}".format(self.port)
+
+    @property
+    def download_url(self):
+        return "http://127.0.0.1:{}/download/{{}}".format(self.port)
+
+    def fail_downloads(self, *failures):
+        """Queues failures for the next downloads, eg fail_downloads(503, "stall")"""
+
+        with self._lock:
+            self._failures.extend(failures)
+
+    def expire_crumb(self):
+        """Rejects the current crumb, as Yahoo does once it's expired"""
+
+        with self._lock:
+            self.valid_crumb = None
+
+    def quote(self):
+        with self._lock:
+            self.requests["quote"] += 1
+            self.crumbs_issued += 1
+            self.valid_crumb = "crumb-{}".format(self.crumbs_issued)
+
+        return 200, ('<script>"CrumbStore":{"crumb":"%s"}</script>' % self.valid_crumb).encode()
+
+    def download(self, symbol, query):
+        with self._lock:
+            self.requests["download"] += 1
+            failure = self._failures.pop(0) if self._failures else None
+            crumb_ok = query.get("crumb", [None])[0] == self.valid_crumb
+
+        if failure == "stall":
+            time.sleep(self.stall_seconds)
+            failure = 503
+        if failure is not None:
+            return failure, b"Service Unavailable"
+
+        if not crumb_ok:
+            return 401, json.dumps({"finance": {"error": {"description": "Invalid Cookie"}}}).encode()
+
+        if symbol.startswith(MISSING_PREFIX):
+            return 404, json.dumps({"chart": {"error": {"description": "No data found, symbol may be delisted"}}}).encode()
+
+        return 200, self.csv(query)
+
+    def csv(self, query):
+        """Daily or weekly bars between period1 & period2, as Yahoo would return them"""
+
+        start = pd.Timestamp(datetime.fromtimestamp(int(query["period1"][0])).date())
+        end = pd.Timestamp(datetime.fromtimestamp(int(query["period2"][0])).date())
+        df = pd.DataFrame({"Close": CLOSES}, index=TRADING_DAYS)
+        df = df[(df.index >= start) & (df.index <= end)]
+
+        if query["interval"][0] == "1wk":
+            df = df.groupby(df.index.to_period("W-SUN").start_time).last()
+
+        lines = ["Date,Open,High,Low,Close,Adj Close,Volume"]
+        for date, close in zip(df.index, df["Close"]):
+            lines.append("{:%Y-%m-%d},{c},{c},{c},{c},{c},1000".format(date, c=close))
+
+        return ("\n".join(lines) + "\n").encode()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()